@@ -0,0 +1,88 @@
+"""Turn a trace recorded with --record into the SEMS fixture of the benchmarks.
+
+The last GetMonitorDetailByPowerstationId response in the trace is written
+to benchmarks/fixtures, with the station and inverter ids, the names and
+the owner details replaced, and the location rounded to about 10 km.
+
+Run with: python -m benchmarks.anonymise TRACE
+"""
+
+import argparse
+import json
+import os
+
+from gw2pvo import trace
+from benchmarks.pipeline import FIXTURES
+
+ANONYMOUS_ID = '00000000-0000-0000-0000-000000000000'
+ANONYMOUS_SN = '00000DSN000W0000'
+
+REPLACEMENTS = {
+    'powerstation_id' : ANONYMOUS_ID,
+    'pw_id' : ANONYMOUS_ID,
+    'releation_id' : ANONYMOUS_ID,
+    'relationId' : ANONYMOUS_ID,
+    'sn' : ANONYMOUS_SN,
+    'stationname' : 'Anonymised',
+    'name' : 'Inverter',
+    'address' : '',
+    'owner_name' : None,
+    'owner_phone' : None,
+    'owner_email' : 'anonymised@example.com',
+    'check_code' : '000000',
+}
+
+# Fields holding ids, which may be part of other values too
+IDS = ('powerstation_id', 'pw_id', 'releation_id', 'relationId', 'sn')
+
+def identifiers(data, found=None):
+    ''' The ids in data, with their replacement. '''
+    found = {} if found is None else found
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key in IDS and isinstance(value, str) and value:
+                found[value] = REPLACEMENTS[key]
+            identifiers(value, found)
+    elif isinstance(data, list):
+        for value in data:
+            identifiers(value, found)
+    return found
+
+def anonymise(data, secrets):
+    if isinstance(data, dict):
+        result = {}
+        for key, value in data.items():
+            if key in REPLACEMENTS and value is not None:
+                result[key] = REPLACEMENTS[key]
+            elif key in ('latitude', 'longitude') and isinstance(value, (int, float)):
+                result[key] = round(value, 1)
+            else:
+                result[key] = anonymise(value, secrets)
+        return result
+    if isinstance(data, list):
+        return [ anonymise(value, secrets) for value in data ]
+    if isinstance(data, str):
+        # Ids also show up inside other values
+        for secret, replacement in secrets.items():
+            data = data.replace(secret, replacement)
+        return data
+    return data
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('trace', help="Trace recorded with gw2pvo --record", metavar='TRACE')
+    args = parser.parse_args()
+
+    records = [ rec for rec in trace.read(args.trace) if rec['kind'] == 'sems' ]
+    if not records:
+        parser.error("No SEMS responses in " + args.trace)
+    data = records[-1]['data']
+
+    filename = os.path.join(FIXTURES, 'GetMonitorDetailByPowerstationId.json')
+    with open(filename, 'w') as f:
+        json.dump(anonymise(data, identifiers(data)), f, indent=1)
+        f.write('\n')
+    print("Wrote " + filename)
+
+if __name__ == "__main__":
+    main()
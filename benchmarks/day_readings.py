@@ -0,0 +1,90 @@
+"""Compare the dict based day integration with the columnar DayReadings.
+
+Run with: python -m benchmarks.day_readings
+"""
+
+import random
+import time
+from datetime import datetime, timedelta
+
+from gw2pvo.day_readings import DayReadings
+
+def sems_day(date):
+    pacs = []
+    xy = []
+    for i in range(288):
+        moment = date + timedelta(minutes=5 * i)
+        pacs.append({
+            'date' : moment.strftime("%m/%d/%Y %H:%M:%S"),
+            'pac' : random.choice([-1, 0]) if i < 70 or i > 220 else random.randint(0, 5000),
+        })
+        xy.append({ 'y' : random.randint(100, 3000) })
+    return pacs, xy
+
+def dict_readings(pacs, xy, energy_used):
+    # The loop getDayReadings used before DayReadings
+    hours = 0
+    kwh = 0
+    c_kwh = 0
+    entries = []
+    for p, x in zip(pacs, xy):
+        parsed_date = datetime.strptime(p['date'], "%m/%d/%Y %H:%M:%S")
+        next_hours = parsed_date.hour + parsed_date.minute / 60
+        pgrid_w = p['pac']
+        load = x['y']
+        if pgrid_w >= 0:
+            kwh += pgrid_w / 1000 * (next_hours - hours)
+            c_kwh += load /1000 * (next_hours - hours)
+            entries.append({
+                'dt' : parsed_date,
+                'pgrid_w': pgrid_w,
+                'load': load,
+                'eday_kwh': round(kwh, 3),
+                'energy_used' : round(c_kwh, 3)
+            })
+        hours = next_hours
+    if energy_used > 0:
+        correction = energy_used / c_kwh
+        for sample in entries:
+            sample['energy_used'] *= correction
+    return entries
+
+def main():
+    first = datetime(2020, 1, 1)
+    year = [ sems_day(first + timedelta(days=i)) for i in range(365) ]
+    energy_used = 12.5
+
+    # NumPy rounds halfway cases in binary, so allow for a difference in the last decimal
+    for (pacs, xy) in year[:7]:
+        old = dict_readings(pacs, xy, energy_used)
+        new = list(DayReadings.from_sems(pacs, xy, energy_used))
+        assert len(old) == len(new)
+        for a, b in zip(old, new):
+            assert a['dt'] == b['dt'] and a['pgrid_w'] == b['pgrid_w'] and a['load'] == b['load']
+            assert abs(a['eday_kwh'] - b['eday_kwh']) < 0.0011
+            assert abs(a['energy_used'] - b['energy_used']) < 0.01
+
+    start = time.perf_counter()
+    for pacs, xy in year:
+        dict_readings(pacs, xy, energy_used)
+    old = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for pacs, xy in year:
+        DayReadings.from_sems(pacs, xy, energy_used)
+    new = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for pacs, xy in year:
+        for entry in DayReadings.from_sems(pacs, xy, energy_used):
+            pass
+    rows = time.perf_counter() - start
+
+    samples = sum(len(pacs) for pacs, xy in year)
+    print("{} days, {} samples".format(len(year), samples))
+    print("{:<28} {:>8.3f} s".format("dicts", old))
+    print("{:<28} {:>8.3f} s {:>6.1f}x".format("columns", new, old / new))
+    print("{:<28} {:>8.3f} s {:>6.1f}x".format("columns + row view", rows, old / rows))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Measure the upload pipeline against local SEMS, PVOutput and OpenWeather stand-ins.
+
+Covers run_once end-to-end latency, getDayReadings throughput and add_day
+upload throughput. The stand-ins serve the anonymised responses in
+benchmarks/fixtures, see benchmarks.anonymise to replace them.
+
+Results are saved in benchmarks/results/VERSION.json, which is not kept in
+git as the numbers only compare on the same machine. To get a baseline,
+check out the previous release, run the benchmarks, then check out the
+change and run them again; each run is compared with the most recent
+results of another version.
+
+Run with: python -m benchmarks.pipeline [--latency SECONDS] [--cycles N] [--days N]
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import platform
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from gw2pvo import __main__ as gw2pvo
+from gw2pvo import __version__
+from gw2pvo import gw_api
+from gw2pvo import gw_session
+from gw2pvo import pvo_api
+from gw2pvo import station
+from gw2pvo.day_readings import DayReadings
+from gw2pvo.standin import StandIn
+
+RESULTS = os.path.join(os.path.dirname(__file__), 'results')
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+def recorded_responses():
+    ''' The fixtures by the endpoint name the stand-in serves them for. '''
+    responses = {}
+    for filename in glob.glob(os.path.join(FIXTURES, '*.json')):
+        with open(filename) as f:
+            responses[os.path.splitext(os.path.basename(filename))[0]] = json.load(f)
+    return responses
+
+def recorded_day(responses):
+    ''' The SEMS readings of the recorded day. '''
+    return DayReadings.from_sems(
+        responses['GetPowerStationPacByDayForApp']['pacs'],
+        responses['GetChartByPlant']['lines'][3]['xy'],
+        responses['GetChartByPlant']['modelData']['consumptionOfLoad'])
+
+def settings_for(standin):
+    conf_parser = argparse.ArgumentParser(add_help=False)
+    return gw2pvo.build_parser(conf_parser, {}).parse_args([
+        '--gw-station-id', 'standin',
+        '--gw-account', 'bench@example.com',
+        '--gw-password', 'secret',
+        '--pvo-system-id', 'bench',
+        '--pvo-api-key', 'key',
+        '--openweather-api-key', 'key',
+        '--sems-url', standin.url + 'api/',
+        '--pvo-url', standin.url + 'service/r2/',
+        '--openweather-url', standin.url + 'data/2.5/',
+    ])
+
+def run_once_latency(standin, cycles):
+    settings = settings_for(standin)
+    gw2pvo.check_settings(settings)
+    state = station.Station(None, settings)
+    latencies = []
+    for i in range(cycles):
+        start = time.perf_counter()
+        gw2pvo.run_once(settings, None, state)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        'run_once_median_ms' : statistics.median(latencies) * 1000,
+        'run_once_p95_ms' : latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+def day_readings_throughput(standin, days):
+    goodwe = gw_api.GoodWeApi('standin', 'bench@example.com', 'secret', gw_session.SessionStore(), global_url=standin.url + 'api/')
+    first = datetime(2020, 6, 1)
+    start = time.perf_counter()
+    readings = 0
+    for i in range(days):
+        readings += len(goodwe.getDayReadings(first + timedelta(days=i))['entries'])
+    fetched = time.perf_counter() - start
+
+    # The parsing alone, without the HTTP round-trips
+    responses = recorded_responses()
+    start = time.perf_counter()
+    for i in range(days):
+        recorded_day(responses)
+    parsed = time.perf_counter() - start
+
+    return {
+        'day_readings_days_per_s' : days / fetched,
+        'day_readings_parse_per_s' : readings / parsed,
+    }
+
+def add_day_throughput(standin, days, batch_size):
+    pvo = pvo_api.PVOutputApi(None, None, 'bench', 'key', batch_size=batch_size, base_url=standin.url + 'service/r2/')
+    first = datetime(2020, 6, 1)
+    entries = [ recorded_day(recorded_responses()) ] * days
+    temperatures = [ { 'time' : (first + timedelta(hours=h)).timestamp(), 'temperature' : 15.0 } for h in range(days * 24) ]
+    start = time.perf_counter()
+    readings = 0
+    for day in entries:
+        pvo.add_day(day, temperatures)
+        readings += len(day)
+    return {
+        'add_day_{}_readings_per_s'.format(batch_size) : readings / (time.perf_counter() - start),
+    }
+
+def previous_results():
+    ''' The most recently saved results of another version. '''
+    files = [ f for f in glob.glob(os.path.join(RESULTS, '*.json')) if os.path.basename(f) != __version__ + '.json' ]
+    if not files:
+        return None
+    with open(max(files, key=os.path.getmtime)) as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', help="Seconds each stand-in response is delayed (default 0.005)", type=float, default=0.005)
+    parser.add_argument('--cycles', help="run_once cycles (default 200)", type=int, default=200)
+    parser.add_argument('--days', help="Days to fetch and upload (default 30)", type=int, default=30)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger().handlers[0].addFilter(station.StationLogFilter())
+
+    with StandIn(responses=recorded_responses(), latency=args.latency, rate_limit=1000000) as standin:
+        results = {}
+        results.update(run_once_latency(standin, args.cycles))
+        results.update(day_readings_throughput(standin, args.days))
+        results.update(add_day_throughput(standin, args.days, 30))
+        results.update(add_day_throughput(standin, args.days, 100))
+
+    previous = previous_results()
+    print("gw2pvo {}, stand-in latency {:.1f} ms".format(__version__, args.latency * 1000))
+    for name, value in results.items():
+        line = "{:<32} {:>12.2f}".format(name, value)
+        if previous and name in previous['results']:
+            line += "  {:>12.2f} in {} ({:+.1f}%)".format(
+                previous['results'][name],
+                previous['version'],
+                (value / previous['results'][name] - 1) * 100)
+        print(line)
+
+    os.makedirs(RESULTS, exist_ok=True)
+    with open(os.path.join(RESULTS, __version__ + '.json'), 'w') as f:
+        json.dump({
+            'version' : __version__,
+            'time' : datetime.now().isoformat(timespec='seconds'),
+            'python' : platform.python_version(),
+            'latency' : args.latency,
+            'cycles' : args.cycles,
+            'days' : args.days,
+            'results' : results,
+        }, f, indent=2)
+        f.write('\n')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Measure the import time of gw2pvo with python -X importtime.
+
+A cron run starts a new interpreter every few minutes, so the modules it
+loads before talking to SEMS add up. The optional backends must only be
+loaded when configured: the benchmark fails if a plain import of gw2pvo
+pulls in one of them. The results are added to benchmarks/results/VERSION.json
+and compared with the most recent results of another version.
+
+Run with: python -m benchmarks.startup [--runs N]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from gw2pvo import __version__
+from benchmarks.pipeline import RESULTS, previous_results
+
+# Not needed to upload a SEMS reading to PVOutput
+OPTIONAL = ('telegram', 'astral', 'paho', 'oauthlib', 'requests_oauthlib', 'numpy', 'gw2pvo.mqtt', 'gw2pvo.ds_api', 'gw2pvo.ow_api', 'gw2pvo.netatmo_api')
+
+def import_times():
+    ''' The cumulative import time in microseconds of each top level module. '''
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import gw2pvo.__main__'],
+        stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[12:].split('|')
+        times[name.strip()] = int(cumulative_us)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', help="Interpreters to start (default 20)", type=int, default=20)
+    args = parser.parse_args()
+
+    runs = [ import_times() for i in range(args.runs) ]
+    loaded = sorted(set(name for times in runs for name in times))
+    optional = [ name for name in loaded if name.split('.')[0] in OPTIONAL or name in OPTIONAL ]
+
+    results = {
+        'import_gw2pvo_median_ms' : statistics.median(times['gw2pvo.__main__'] for times in runs) / 1000,
+        'import_requests_median_ms' : statistics.median(times.get('requests', 0) for times in runs) / 1000,
+        'imported_modules' : len(loaded),
+    }
+
+    previous = previous_results()
+    print("gw2pvo {}, {} runs".format(__version__, args.runs))
+    for name, value in results.items():
+        line = "{:<32} {:>12.2f}".format(name, value)
+        if previous and name in previous['results']:
+            line += "  {:>12.2f} in {} ({:+.1f}%)".format(
+                previous['results'][name],
+                previous['version'],
+                (value / previous['results'][name] - 1) * 100)
+        print(line)
+
+    # Add to the results of benchmarks.pipeline
+    filename = os.path.join(RESULTS, __version__ + '.json')
+    saved = { 'version' : __version__, 'results' : {} }
+    if os.path.exists(filename):
+        with open(filename) as f:
+            saved = json.load(f)
+    saved['results'].update(results)
+    os.makedirs(RESULTS, exist_ok=True)
+    with open(filename, 'w') as f:
+        json.dump(saved, f, indent=2)
+        f.write('\n')
+
+    if optional:
+        print("Loaded without being configured: " + ", ".join(optional))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
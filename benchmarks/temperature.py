@@ -0,0 +1,47 @@
+"""Compare the temperature lookup of add_day before and after TemperatureSeries.
+
+Run with: python -m benchmarks.temperature
+"""
+
+import random
+import time
+import timeit
+
+from gw2pvo.temperature import TemperatureSeries
+
+def hourly_samples(days):
+    start = int(time.time()) - days * 86400
+    return [
+        { 'time' : start + hour * 3600, 'temperature' : round(random.uniform(5, 25), 1) }
+        for hour in range(days * 24)
+    ]
+
+def reading_times(samples, interval=300):
+    first = samples[0]['time']
+    last = samples[-1]['time']
+    return list(range(first, last, interval))
+
+def filter_lookup(samples, times):
+    # The linear scan add_day used to do for every reading
+    return [ list(filter(lambda x: t >= x['time'], samples))[-1]['temperature'] for t in times ]
+
+def series_lookup(samples, times, interpolate=False):
+    series = TemperatureSeries(samples, interpolate)
+    return [ series.at(t) for t in times ]
+
+def main():
+    print("{:>6} {:>9} {:>12} {:>12} {:>12} {:>9}".format(
+        'days', 'readings', 'filter (s)', 'bisect (s)', 'interp. (s)', 'speed-up'))
+    for days in [1, 3, 14, 90]:
+        samples = hourly_samples(days)
+        times = reading_times(samples)
+        assert filter_lookup(samples, times[:500]) == series_lookup(samples, times[:500])
+        number = 1 if days > 14 else 3
+        old = min(timeit.repeat(lambda: filter_lookup(samples, times), number=number, repeat=3)) / number
+        new = min(timeit.repeat(lambda: series_lookup(samples, times), number=number, repeat=3)) / number
+        interp = min(timeit.repeat(lambda: series_lookup(samples, times, True), number=number, repeat=3)) / number
+        print("{:>6} {:>9} {:>12.4f} {:>12.4f} {:>12.4f} {:>8.0f}x".format(
+            days, len(times), old, new, interp, old / new))
+
+if __name__ == "__main__":
+    main()
@@ -6,23 +6,34 @@ if sys.version_info < (3,6):
 
 import logging
 import argparse
+import functools
 import locale
+import math
+import signal
 import time
-import telegram
 
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from configparser import ConfigParser
-from astral import LocationInfo
-from astral.geocoder import lookup, database
-from astral.location import Location
 
-from gw2pvo import ds_api
-from gw2pvo import ow_api
+from gw2pvo import archive
+from gw2pvo import backfill
+from gw2pvo import cache
+from gw2pvo import freshness
 from gw2pvo import gw_api
-from gw2pvo import mqtt
-from gw2pvo import netatmo_api
+from gw2pvo import gw_session
+from gw2pvo import metrics
+from gw2pvo import notify
+from gw2pvo import outbox
 from gw2pvo import gw_csv
 from gw2pvo import pvo_api
+from gw2pvo import schedule
+from gw2pvo import solar
+from gw2pvo import station
+from gw2pvo import temperature
+from gw2pvo import trace
+from gw2pvo import transport
+from gw2pvo import weather_cache
 from gw2pvo import __version__
 
 __author__ = "Mark Ruys"
@@ -31,52 +42,132 @@ __license__ = "MIT"
 __email__ = "mark@paracas.nl"
 __doc__ = "Upload GoodWe power inverter data to PVOutput.org"
 
-last_eday_kwh = 0
-last_energy_used = 0
+# SEMS logins, shared by all GoodWeApi instances of this process
+gw_sessions = gw_session.SessionStore()
 
-# Telegram
-def telegram_notify(telegram_token, telegram_chatid, message):
-    token = telegram_token
-    chat_id = telegram_chatid
-    bot = telegram.Bot(token=token)
-    bot.sendMessage(chat_id=chat_id, text=message)
+# Readings waiting to be uploaded to PVOutput
+pvo_outbox = None
 
-def get_temperature(settings, latitude, longitude):
+# History of all readings
+readings_archive = None
+
+# Outside temperatures by location
+weather = weather_cache.WeatherCache()
+
+# When each SEMS station gets its next reading
+sems_freshness = freshness.FreshnessStore()
+
+# The optional backends (MQTT, Telegram, Dark Sky, OpenWeather, Astral) and
+# NumPy are imported where they are first used, so a cron run that only talks
+# to SEMS and PVOutput does not pay for loading them.
+
+def get_temperature(settings, latitude, longitude, timeout=None):
     if settings.darksky_api_key:
+        from gw2pvo import ds_api
         ds = ds_api.DarkSkyApi(settings.darksky_api_key)
-        return ds.get_temperature(latitude, longitude)
+        return weather.get(latitude, longitude, lambda: ds.get_temperature(latitude, longitude), timeout)
     elif settings.openweather_api_key:
-        ow = ow_api.OpenWeatherApi(settings.openweather_api_key)
-        return ow.get_temperature(latitude, longitude)
+        from gw2pvo import ow_api
+        ow = ow_api.OpenWeatherApi(settings.openweather_api_key, base_url=settings.openweather_url)
+        return weather.get(latitude, longitude, lambda: ow.get_temperature(latitude, longitude), timeout)
     return None
 
-def run_once(settings, city):
-    global last_eday_kwh
-    global last_energy_used
-
-    # Check if we only want to run during daylight
-    if city:
-        now = datetime.time(datetime.now())
-    #    if now < city.dawn().time() or now > city.dusk().time():
-    #        logging.debug("Skipped upload as it's night")
-    #        return
+def resample_reading(settings, state, data, now):
+    if state.resampler is None:
+        from gw2pvo import resample
+        state.resampler = resample.Resampler(settings.pvo_interval * 60,
+            mean=('pgrid_w', 'load', 'grid_voltage', 'pv_voltage'),
+            last=('eday_kwh', 'energy_used'),
+            extremes=('grid_voltage', 'pv_voltage'),
+            slack=60)
+    # MQTT collects all samples since the previous cycle, SEMS only has the current one
+    samples = data.get('samples') or [ (now, data) ]
+    for timestamp, sample in samples:
+        state.resampler.add(timestamp, sample)
+    return state.resampler.close(now)
+
+def smooth_reading(settings, state, reading):
+    ''' A copy of reading with pgrid_w and load replaced by their moving averages. '''
+    if not settings.smooth:
+        return reading
+    if state.smoothers is None:
+        from gw2pvo import average
+        state.smoothers = { name : average.smoother(settings.smooth, settings.smooth_window) for name in ('pgrid_w', 'load') }
+    reading = dict(reading)
+    for name, smoother in state.smoothers.items():
+        reading[name] = smoother.add(reading[name])
+    return reading
+
+def prepare_day(settings):
+    ''' Resample and/or smooth the readings of a backfilled day, as configured. '''
+    def prepare(entries):
+        if settings.resample:
+            entries = entries.resample((settings.pvo_interval or 5) * 60)
+        if settings.smooth:
+            entries = entries.smooth(settings.smooth, settings.smooth_window)
+        return entries
+    return prepare
+
+def wait_for_refresh(settings, cycle):
+    ''' Sleep until SEMS is expected to have a new reading of the station,
+    return False when that is after the fetch deadline of this cycle. '''
+    expected = sems_freshness.get(settings.gw_station_id).expected()
+    if expected is None:
+        return True
+    delay = expected + freshness.MARGIN - time.time()
+    if delay > cycle.remaining('fetch') - settings.http_timeout:
+        return False
+    if delay > 0:
+        logging.debug("Waiting {:.0f} seconds for a new SEMS reading".format(delay))
+        time.sleep(delay)
+    return True
+
+def station_key(settings):
+    ''' The station readings are archived under. '''
+    return settings.gw_station_id or settings.mqtt_topic
+
+def drain_outbox(settings, cycle):
+    ''' Retry the readings left in the outbox, for a cycle without a new reading. '''
+    if pvo_outbox is None or not (settings.pvo_system_id and settings.pvo_api_key):
+        return
+    pvo = pvo_api.PVOutputApi(settings.telegram_token, settings.telegram_chatid, settings.pvo_system_id, settings.pvo_api_key, outbox=pvo_outbox, batch_size=settings.pvo_batch_size, base_url=settings.pvo_url, deadline=cycle.deadline('upload'))
+    with cycle.stage('upload'):
+        pvo.drain_outbox()
+
+def run_once(settings, city, state):
+
+    # The deadlines of the stages, when not run by the scheduler
+    cycle = state.cycle or schedule.Cycle(time.monotonic(), (settings.pvo_interval or 5) * 60)
 
     if settings.mqtt_host:
-        if settings.gw_station_id:
-            logging.error("Bad configuration options. Choose either Goodwe or MQTT as source for inverter data. Both cannot be used simultaniously.")
-            sys.exit(1)
     # Fetch the latest reading from MQTT broker
-        mqtt_broker = mqtt.MQTT(settings.telegram_token, settings.telegram_chatid, settings.mqtt_host, settings.mqtt_port, settings.mqtt_user, settings.mqtt_password, settings.mqtt_topic)
-        data = mqtt_broker.getCurrentReadings()
+        if state.mqtt_broker is None:
+            from gw2pvo import mqtt
+            state.mqtt_broker = mqtt.MQTT(settings.telegram_token, settings.telegram_chatid, settings.mqtt_host, settings.mqtt_port, settings.mqtt_user, settings.mqtt_password, settings.mqtt_topic, settings.mqtt_timeout,
+                max_age=(settings.pvo_interval or 5) * 60)
+        with cycle.stage('fetch'):
+            data = state.mqtt_broker.getCurrentReadings(cycle.remaining('fetch'))
     elif settings.gw_station_id:
     # Fetch the last reading from GoodWe
-        goodwe = gw_api.GoodWeApi(settings.gw_station_id, settings.gw_account, settings.gw_password)
-        data = goodwe.getCurrentReadings()
+        goodwe = gw_api.GoodWeApi(settings.gw_station_id, settings.gw_account, settings.gw_password, gw_sessions, global_url=settings.sems_url, deadline=cycle.deadline('fetch'))
+        if settings.adaptive_polling and not wait_for_refresh(settings, cycle):
+            logging.debug("Skipped cycle as SEMS has no new reading yet")
+            metrics.SKIPPED_UPLOADS.inc(reason='unchanged', station=station.current())
+            drain_outbox(settings, cycle)
+            return
+        with cycle.stage('fetch'):
+            data = goodwe.getCurrentReadings()
+        if settings.adaptive_polling and not sems_freshness.update(settings.gw_station_id, data['taken'], time.time()):
+            logging.debug("Skipped upload as SEMS has no new reading")
+            metrics.SKIPPED_UPLOADS.inc(reason='unchanged', station=station.current())
+            drain_outbox(settings, cycle)
+            return
 
     # Check if we want to abort when offline
     if settings.skip_offline:
         if data['status'] == 'Offline':
             logging.debug("Skipped upload as the inverter is offline")
+            metrics.SKIPPED_UPLOADS.inc(reason='offline', station=station.current())
             return
 
     # Append reading to CSV file
@@ -84,153 +175,351 @@ def run_once(settings, city):
         if data['status'] == 'Offline':
             logging.debug("Don't append offline data to CSV file")
         else:
-            locale.setlocale(locale.LC_ALL, locale.getlocale())
-            csv = gw_csv.GoodWeCSV(settings.csv)
-            csv.append(data)
+            if state.csv_writer is None:
+                state.csv_writer = gw_csv.get_writer(settings.csv, settings.csv_flush_interval)
+            with cycle.stage('csv'):
+                state.csv_writer.append(data)
 
     # Submit reading to PVOutput, if they differ from the previous set
     eday_kwh = data['eday_kwh']
     energy_used = data['energy_used']
 
-    if data['pgrid_w'] == 0 and abs(eday_kwh - last_eday_kwh) < 0.001:
+    if data['pgrid_w'] == 0 and abs(eday_kwh - state.last_eday_kwh) < 0.001:
         logging.debug("Ignore unchanged eday_kwh reading")
     else:
-        last_eday_kwh = eday_kwh
+        state.last_eday_kwh = eday_kwh
 
-    if data['load'] == 0 and abs(energy_used - last_energy_used) < 0.001:
+    if data['load'] == 0 and abs(energy_used - state.last_energy_used) < 0.001:
         logging.debug("Ignore unchanged energy_used reading")
     else:
-        last_energy_used = energy_used
+        state.last_energy_used = energy_used
 
     # Get the temperature if pulling data from GoodWe
     if settings.gw_station_id:
-        temperature = get_temperature(settings, data['latitude'], data['longitude'])
+        with cycle.stage('weather'):
+            temperature = get_temperature(settings, data['latitude'], data['longitude'], cycle.remaining('weather'))
         if temperature:
             data['temperature'] = temperature
 
+    now = state.clock()
+    if readings_archive:
+        readings_archive.add(station_key(settings), now, data)
+
     voltage = data['grid_voltage']
     if settings.pv_voltage:
         voltage=data['pv_voltage']
 
     if settings.pvo_system_id and settings.pvo_api_key:
-        pvo = pvo_api.PVOutputApi(settings.telegram_token, settings.telegram_chatid, settings.pvo_system_id, settings.pvo_api_key)
-        pvo.add_status(data['pgrid_w'], last_eday_kwh, data.get('temperature'), voltage, data['energy_used'], data['load'])
+        pvo = pvo_api.PVOutputApi(settings.telegram_token, settings.telegram_chatid, settings.pvo_system_id, settings.pvo_api_key, outbox=pvo_outbox, batch_size=settings.pvo_batch_size, base_url=settings.pvo_url, deadline=cycle.deadline('upload'))
+        with cycle.stage('upload'):
+            if settings.resample and settings.pvo_interval:
+                # Upload the averages of each completed interval instead of the instantaneous reading
+                for bucket in resample_reading(settings, state, data, now):
+                    bucket = smooth_reading(settings, state, bucket)
+                    voltage = bucket['pv_voltage'] if settings.pv_voltage else bucket['grid_voltage']
+                    pvo.add_status(bucket['pgrid_w'], bucket['eday_kwh'], data.get('temperature'), round(voltage, 1), bucket['energy_used'], bucket['load'], bucket['time'])
+            else:
+                reading = smooth_reading(settings, state, data)
+                pvo.add_status(reading['pgrid_w'], state.last_eday_kwh, data.get('temperature'), voltage, data['energy_used'], reading['load'], now)
     else:
         logging.debug(str(data))
         logging.warning("Missing PVO id and/or key")
 
+def get_temperatures_for_day(settings, data, date):
+    if settings.darksky_api_key:
+        from gw2pvo import ds_api
+        ds = ds_api.DarkSkyApi(settings.darksky_api_key)
+        samples = ds.get_temperature_for_day(data['latitude'], data['longitude'], date)
+    elif settings.openweather_api_key:
+        from gw2pvo import ow_api
+        ow = ow_api.OpenWeatherApi(settings.openweather_api_key, base_url=settings.openweather_url)
+        samples = ow.get_temperature_for_day(data['latitude'], data['longitude'], date)
+    else:
+        return None
+    if samples is None:
+        return None
+    return temperature.TemperatureSeries(samples, settings.interpolate_temperature)
+
+def copy_dates(settings):
+    if settings.date:
+        return [ datetime.strptime(settings.date, "%Y-%m-%d") ]
+    first = datetime.strptime(settings.date_from, "%Y-%m-%d")
+    if settings.date_to:
+        last = datetime.strptime(settings.date_to, "%Y-%m-%d")
+    else:
+        last = datetime.strptime(datetime.now().strftime("%Y-%m-%d"), "%Y-%m-%d")
+    return backfill.date_range(first, last)
+
 # Get historic data from GoodWe and publish to PVOutput
 def copy(settings):
+    ''' Copy the readings of the --date range, return whether all days were copied. '''
+    if settings.from_archive:
+        return copy_archive(settings)
+
     # Confirm that MQTT config is not used for historic data
     if settings.mqtt_host:
-        logging.error("Bad configuration options. MQTT cannot be used for backfilling historic data. Remove MQTT options from configuration and specify Goodwe (SEMS Portal details).")
-        sys.exit(1)
+        raise Exception("Bad configuration options. MQTT cannot be used for backfilling historic data. Remove MQTT options from configuration and specify Goodwe (SEMS Portal details).")
 
-    # Fetch readings from GoodWe
-    date = datetime.strptime(settings.date, "%Y-%m-%d")
-    goodwe = gw_api.GoodWeApi(settings.gw_station_id, settings.gw_account, settings.gw_password)
-    data = goodwe.getDayReadings(date)
+    goodwe = gw_api.GoodWeApi(settings.gw_station_id, settings.gw_account, settings.gw_password, gw_sessions, global_url=settings.sems_url)
 
     if settings.pvo_system_id and settings.pvo_api_key:
-        if settings.darksky_api_key:
-            ds = ds_api.DarkSkyApi(settings.darksky_api_key)
-            temperatures = ds.get_temperature_for_day(data['latitude'], data['longitude'], date)
-        elif settings.openweather_api_key:
-            ow = ow_api.OpenWeatherApi(settings.openweather_api_key)
-            temperatures = ow.get_temperature_for_day(data['latitude'], data['longitude'], date)
-        else:
-            temperatures = None
-
-        # Submit readings to PVOutput
-        pvo = pvo_api.PVOutputApi(settings.telegram_token, settings.telegram_chatid, settings.pvo_system_id, settings.pvo_api_key)
-        pvo.add_day(data['entries'], temperatures)
+        pvo = pvo_api.PVOutputApi(settings.telegram_token, settings.telegram_chatid, settings.pvo_system_id, settings.pvo_api_key, batch_size=settings.pvo_batch_size, base_url=settings.pvo_url)
     else:
-        for entry in data['entries']:
-            logging.info("{}: {:6.0f} W {:6.2f} kWh".format(
-                entry['dt'],
-                entry['pgrid_w'],
-                entry['eday_kwh'],
-            ))
+        pvo = None
+
+    # Fetch readings from GoodWe while uploading completed days to PVOutput
+    store = None
+    if readings_archive:
+        store = lambda entries: readings_archive.add_day(station_key(settings), entries)
+
+    job = backfill.Backfill(goodwe, pvo, lambda data, date: get_temperatures_for_day(settings, data, date), settings.backfill_workers, prepare_day(settings), store)
+    copied = job.run(copy_dates(settings))
+
+    if pvo is None:
         logging.warning("Missing PVO id and/or key")
+    return copied
 
-def copy_csv(settings):
-    pvo = pvo_api.PVOutputApi(settings.telegram_token, settings.telegram_chatid, settings.pvo_system_id, settings.pvo_api_key)
-    pvo.add_day_csv(settings.upload_csv)
-    sys.exit(0)
+# Publish archived readings to PVOutput, without going back to GoodWe
+def copy_archive(settings):
+    if readings_archive is None:
+        logging.error("--from-archive needs an archive, see --archive")
+        sys.exit(1)
 
-def run():
-    defaults = {
-        'log': "info"
-    }
+    dates = copy_dates(settings)
+    start = dates[0].timestamp()
+    end = (dates[-1] + timedelta(days=1)).timestamp()
+    key = station_key(settings)
 
-    # Parse any config file specification. We make this parser with add_help=False so
-    # that it doesn't parse -h and print help.
-    conf_parser = argparse.ArgumentParser(
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        add_help=False
-    )
-    conf_parser.add_argument("--config", help="Specify config file", metavar='FILE')
-    args, remaining_argv = conf_parser.parse_known_args()
-    
-    # Read configuration file and add it to the defaults hash.
-    if args.config:
-        config = ConfigParser()
-        config.read(args.config)
-        if "Defaults" in config:
-            defaults.update(dict(config.items("Defaults")))
-        else:
-            logging.error("Bad config file, missing Defaults section")
-            sys.exit(1)
+    if settings.pvo_system_id and settings.pvo_api_key:
+        pvo = pvo_api.PVOutputApi(settings.telegram_token, settings.telegram_chatid, settings.pvo_system_id, settings.pvo_api_key, batch_size=settings.pvo_batch_size, base_url=settings.pvo_url)
+        return pvo.add_csv_rows(readings_archive.csv_rows(key, start, end, settings.pv_voltage))
+    for day in readings_archive.daily(key, start, end):
+        logging.info("{date}: {readings} readings, {eday_kwh} kWh generated, {energy_used} kWh used, peak {peak_w} W".format(**day))
+    logging.warning("Missing PVO id and/or key")
+    return True
 
-    # Parse rest of arguments
+def copy_csv(settings):
+    pvo = pvo_api.PVOutputApi(settings.telegram_token, settings.telegram_chatid, settings.pvo_system_id, settings.pvo_api_key, batch_size=settings.pvo_batch_size, base_url=settings.pvo_url)
+    sys.exit(0 if pvo.add_day_csv(settings.upload_csv) else 1)
+
+def terminate(signum, frame):
+    ''' Exit through the finally clauses, which flush the CSV files and send the queued notifications. '''
+    logging.info("Stopping on signal {}".format(signum))
+    sys.exit(0)
+
+def report_failure(settings, exp):
+    currentTime = datetime.now()
+    errorMsg = ("Failed to publish data PVOutput - " + str(exp))
+    logging.error(str(currentTime) + " - " + str(errorMsg))
+    notify.telegram(settings.telegram_token, settings.telegram_chatid, errorMsg)
+
+def solar_schedule(state, city):
+    ''' Dawn and dusk of a station, if it does not poll at night. '''
+    settings = state.settings
+    if state.solar is None and (city or settings.skip_night):
+        if city:
+            state.solar = solar.SolarSchedule(city.observer, city.tzinfo)
+        elif settings.gw_station_id:
+            # The location SEMS reported in an earlier cycle
+            info = gw_sessions.get_station(settings.gw_station_id, gw_api.STATION_INFO_MAX_AGE)
+            try:
+                state.solar = solar.SolarSchedule.at(info['latitude'], info['longitude'])
+            except (TypeError, ValueError):
+                pass
+    return state.solar
+
+def resume_time(stations, city, moment):
+    ''' The first timestamp from moment on any station polls. '''
+    times = []
+    for state in stations:
+        daylight = solar_schedule(state, city)
+        if daylight is None:
+            return moment
+        times.append(daylight.next_active(moment, (state.settings.pvo_interval or 5) * 60))
+    return min(times)
+
+def run_station(state, city, start=None):
+    ''' Run a cycle of a station, which was scheduled to start at time.monotonic() start. '''
+    name = state.label()
+    interval = (state.settings.pvo_interval or 5) * 60
+    daylight = solar_schedule(state, city)
+    if daylight and not daylight.active(time.time(), interval):
+        with state:
+            logging.debug("Skipped cycle as it's night")
+        return
+    state.cycle = schedule.Cycle(time.monotonic() if start is None else start, interval)
+    with state, metrics.CYCLE_SECONDS.time(station=name):
+        try:
+            run_once(state.settings, city, state)
+        except KeyboardInterrupt:
+            raise
+        except Exception as exp:
+            metrics.CYCLE_FAILURES.inc(station=name)
+            report_failure(state.settings, exp)
+
+def run_stations(stations, city, executor, start=None):
+    ''' Run one cycle for all stations, a failing station does not affect the others. '''
+    if executor is None:
+        for state in stations:
+            run_station(state, city, start)
+        return
+    futures = [ executor.submit(run_station, state, city, start) for state in stations ]
+    for future in futures:
+        future.result()
+
+def build_parser(conf_parser, defaults):
     parser = argparse.ArgumentParser(
         description=__doc__,
         parents=[conf_parser],
     )
-    parser.set_defaults(**defaults)
     parser.add_argument("--gw-station-id", help="GoodWe station ID", metavar='ID')
     parser.add_argument("--gw-account", help="GoodWe account", metavar='ACCOUNT')
     parser.add_argument("--gw-password", help="GoodWe password", metavar='PASSWORD')
+    parser.add_argument("--gw-session-file", help="Cache the SEMS login in FILE (default in cron mode: ~/.cache/gw2pvo/sems-session.json)", metavar='FILE')
     parser.add_argument("--mqtt-host", help="MQTT hostname", metavar='MQTT_HOST')
     parser.add_argument("--mqtt-port", help="MQTT port", metavar='MQTT_USER')
     parser.add_argument("--mqtt-user", help="MQTT username", metavar='MQTT_USER')
     parser.add_argument("--mqtt-password", help="MQTT password", metavar='MQTT_PASS')
     parser.add_argument("--mqtt-topic", help="MQTT topic", metavar='MQTT_TOPIC')
+    parser.add_argument("--mqtt-timeout", help="Seconds to wait for missing or stale MQTT readings (default 30)", type=float, default=30, metavar='SECONDS')
     parser.add_argument("--pvo-system-id", help="PVOutput system ID", metavar='ID')
     parser.add_argument("--pvo-api-key", help="PVOutput API key", metavar='KEY')
     parser.add_argument("--pvo-interval", help="PVOutput interval in minutes", type=int, choices=[5, 10, 15])
+    parser.add_argument("--pvo-batch-size", help="Readings per batch upload, 100 in donation mode (default 30)", type=int, choices=[30, 100], default=30)
+    parser.add_argument("--archive", help="Keep all readings in FILE, empty to disable (default ~/.cache/gw2pvo/archive.sqlite)", metavar='FILE')
+    parser.add_argument("--pvo-outbox", help="Queue readings in FILE until PVOutput accepted them, empty to disable (default ~/.cache/gw2pvo/outbox.sqlite)", metavar='FILE')
     parser.add_argument("--telegram-token", help="Telegram bot token", metavar='TELEGRAM_TOKEN')
     parser.add_argument("--telegram-chatid", help="Telegram chat id", metavar='TELEGRAM_CHATID')
+    parser.add_argument("--telegram-interval", help="Minutes before an identical Telegram message is sent again (default 60)", type=float, default=60, metavar='MINUTES')
     parser.add_argument("--darksky-api-key", help="Dark Sky Weather API key")
     parser.add_argument("--openweather-api-key", help="Open Weather API key")
+    parser.add_argument("--max-workers", help="Stations polled in parallel (default 4)", type=int, default=4, metavar='N')
+    parser.add_argument("--weather-ttl", help="Minutes to reuse a fetched temperature (default 30)", type=float, default=30, metavar='MINUTES')
+    parser.add_argument("--interpolate-temperature", help="Interpolate the hourly temperatures when copying readings", action='store_true')
+    parser.add_argument("--http-pool-size", help="Keep-alive connections per host (default 10)", type=int, default=10, metavar='N')
+    parser.add_argument("--http-timeout", help="HTTP timeout in seconds (default 15)", type=float, default=15, metavar='SECONDS')
     parser.add_argument("--log", help="Set log level (default info)", choices=['debug', 'info', 'warning', 'critical'])
     parser.add_argument("--date", help="Copy all readings (max 14/90 days ago)", metavar='YYYY-MM-DD')
+    parser.add_argument("--date-from", help="Copy all readings from this day on", metavar='YYYY-MM-DD')
+    parser.add_argument("--date-to", help="Copy all readings up to this day (default today)", metavar='YYYY-MM-DD')
+    parser.add_argument("--from-archive", help="Copy readings from the archive instead of from GoodWe", action='store_true')
+    parser.add_argument("--backfill-workers", help="Days downloaded in parallel when copying (default 4)", type=int, default=4, metavar='N')
     parser.add_argument("--upload-csv", help="Upload all readings from csv file (max 14/90 days ago)")
+    parser.add_argument("--resample", help="Upload the average power of each PVOutput interval instead of instantaneous readings", action='store_true')
+    parser.add_argument("--smooth", help="Upload a moving average of the power and consumption", choices=['wma', 'ema'])
+    parser.add_argument("--smooth-window", help="Number of readings to average over (default 3)", type=int, default=3, metavar='N')
     parser.add_argument("--pv-voltage", help="Send pv voltage instead of grid voltage", action='store_true')
     parser.add_argument("--skip-offline", help="Skip uploads when inverter is offline", action='store_true')
     parser.add_argument("--city", help="Sets timezone and skip uploads from dusk till dawn")
+    parser.add_argument("--adaptive-polling", help="Poll SEMS just after it is expected to have a new reading, and skip uploads of unchanged readings", action='store_true')
+    parser.add_argument("--skip-night", help="Stop polling from dusk till dawn at the station location, after a last upload", action='store_true')
     parser.add_argument('--csv', help="Append readings to a Excel compatible CSV file, DATE in the name will be replaced by the current date")
+    parser.add_argument('--csv-flush-interval', help="Write buffered CSV rows at most this many seconds after they were added (default 60)", type=int, default=60, metavar='SECONDS')
+    parser.add_argument('--metrics-port', help="Serve Prometheus metrics on this port", type=int, metavar='PORT')
+    parser.add_argument('--record', help="Record the SEMS responses or MQTT messages to FILE", metavar='FILE')
+    parser.add_argument('--replay', help="Run the uploads through a recorded FILE, against a local PVOutput stand-in", metavar='FILE')
+    parser.add_argument('--replay-speed', help="Replay N times faster than recorded, 0 for as fast as possible (default 0)", type=float, default=0, metavar='N')
+    # Point the API clients elsewhere, e.g. to the local stand-ins of gw2pvo.standin
+    parser.add_argument('--sems-url', help=argparse.SUPPRESS)
+    parser.add_argument('--pvo-url', help=argparse.SUPPRESS)
+    parser.add_argument('--openweather-url', help=argparse.SUPPRESS)
     parser.add_argument('--version', action='version', version='%(prog)s ' + __version__)
-    args = parser.parse_args()
+    # Set last, so the config file overrides the defaults of the arguments above
+    parser.set_defaults(**defaults)
+    return parser
+
+def config_options(config, section):
+    # Accept both gw-station-id and gw_station_id style keys
+    return { key.replace('-', '_') : value for key, value in config.items(section) }
+
+def check_settings(args):
+    for option in ['skip_offline', 'skip_night', 'adaptive_polling', 'pv_voltage', 'interpolate_temperature', 'resample', 'from_archive']:
+        value = getattr(args, option)
+        if isinstance(value, str):
+            setattr(args, option, value.lower() in ['true', 'yes', 'on', '1'])
+
+    if args.upload_csv is None:
+        if args.gw_station_id is None or args.gw_account is None or args.gw_password is None:
+            if args.mqtt_host is None or args.mqtt_topic is None:
+                logging.error("Missing configuation. Either MQTT configuration or Goodwe (SEMS Portal) credentails need to be provided.\nPlease add either --gw-station-id, --gw-account and --gw-password OR add --mqtt-host and --mqtt-topic (at a minimum). Alternatively, one of these options can also be configured in a configuration file.")
+                sys.exit(1)
+
+    if args.mqtt_host and args.gw_station_id:
+        logging.error("Bad configuration options. Choose either Goodwe or MQTT as source for inverter data. Both cannot be used simultaniously.")
+        sys.exit(1)
+
+    # The moving average of live readings lives in the running process
+    if args.smooth and not args.pvo_interval and not (args.date or args.date_from or args.upload_csv):
+        logging.warning("--smooth has no effect on live uploads without --pvo-interval, as every cron run starts a new average")
+
+def run():
+    defaults = {
+        'log': "info"
+    }
+    sections = {}
+
+    # Parse any config file specification. We make this parser with add_help=False so
+    # that it doesn't parse -h and print help.
+    conf_parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        add_help=False
+    )
+    conf_parser.add_argument("--config", help="Specify config file", metavar='FILE')
+    args, remaining_argv = conf_parser.parse_known_args()
+    
+    # Read configuration file and add it to the defaults hash. Any other
+    # section describes a station, which inherits the Defaults.
+    if args.config:
+        config = ConfigParser()
+        config.read(args.config)
+        if "Defaults" in config:
+            defaults.update(config_options(config, "Defaults"))
+        else:
+            logging.error("Bad config file, missing Defaults section")
+            sys.exit(1)
+        for section in config.sections():
+            if section != "Defaults":
+                sections[section] = config_options(config, section)
+
+    # Parse rest of arguments
+    parser = build_parser(conf_parser, defaults)
+    args = parser.parse_args(remaining_argv)
 
     # Configure the logging
     numeric_level = getattr(logging, args.log.upper(), None)
     if not isinstance(numeric_level, int):
         raise ValueError('Invalid log level: %s' % loglevel)
-    logging.basicConfig(format='%(levelname)-8s %(message)s', level=numeric_level)
+    logging.basicConfig(format='%(levelname)-8s %(station)s%(message)s', level=numeric_level)
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(station.StationLogFilter())
 
     logging.debug("gw2pvo version " + __version__)
 
-    if isinstance(args.skip_offline, str):
-        args.skip_offline = args.skip_offline.lower() in ['true', 'yes', 'on', '1']
+    # Stopping a container sends SIGTERM
+    signal.signal(signal.SIGTERM, terminate)
 
-    if args.upload_csv is None:
-        if args.gw_station_id is None or args.gw_account is None or args.gw_password is None:
-            if args.mqtt_host is None or args.mqtt_topic is None:
-                logging.error("Missing configuation. Either MQTT configuration or Goodwe (SEMS Portal) credentails need to be provided.\nPlease add either --gw-station-id, --gw-account and --gw-password OR add --mqtt-host and --mqtt-topic (at a minimum). Alternatively, one of these options can also be configured in a configuration file.")
-                sys.exit(1)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+
+    if sections:
+        stations = []
+        for name, options in sections.items():
+            settings = build_parser(conf_parser, dict(defaults, **options)).parse_args(remaining_argv)
+            with station.Station(name, settings) as state:
+                check_settings(settings)
+            stations.append(state)
+    else:
+        check_settings(args)
+        stations = [ station.Station(None, args) ]
+
+    # Only a daemon runs the stations on their own interval
+    if not args.pvo_interval and any(state.settings.pvo_interval for state in stations):
+        logging.error("Bad configuration options. Set pvo_interval in the Defaults section as well, a station can only override it with another interval.")
+        sys.exit(1)
 
     if args.city:
+        from astral.geocoder import lookup, database
+        from astral.location import Location
         city = Location(lookup(args.city, database()))
         os.environ['TZ'] = city.timezone
         time.tzset()
@@ -238,43 +527,134 @@ def run():
         city = None
     logging.debug("Timezone {}".format(datetime.now().astimezone().tzinfo))
 
+    transport.configure(args.http_pool_size, args.http_timeout)
+
+    # Cron runs remember which messages they sent, so a failure is not reported every run
+    notify.configure(args.telegram_interval * 60, persistent=args.pvo_interval is None and not args.replay)
+
+    # A replay must not touch the real caches, nor queue readings for the real PVOutput
+    if args.replay:
+        args.gw_session_file = None
+        args.archive = args.archive or ''
+        args.pvo_outbox = args.pvo_outbox or ':memory:'
+
+    # A daemon keeps its SEMS login in memory, cron runs share it through a file
+    global gw_sessions
+    if args.gw_session_file:
+        gw_sessions = gw_session.SessionStore(args.gw_session_file)
+    elif args.pvo_interval is None and not args.replay:
+        gw_sessions = gw_session.SessionStore(cache.cache_file('sems-session.json'))
+
+    global weather
+    weather = weather_cache.WeatherCache(args.weather_ttl * 60, None if args.replay else cache.cache_file('weather.json'))
+
+    global sems_freshness
+    if args.pvo_interval is None and not args.replay:
+        sems_freshness = freshness.FreshnessStore(cache.cache_file('sems-freshness.json'))
+
+    global readings_archive
+    if args.archive is None:
+        args.archive = cache.cache_file('archive.sqlite')
+    if args.archive:
+        readings_archive = archive.Archive(args.archive)
+
+    # Readings that failed to upload are kept and retried in the next cycles
+    global pvo_outbox
+    if args.pvo_outbox is None:
+        args.pvo_outbox = cache.cache_file('outbox.sqlite')
+    if args.pvo_outbox:
+        pvo_outbox = outbox.Outbox(args.pvo_outbox, max_age_days=90 if args.pvo_batch_size == 100 else 14)
+
     # Check if we want to copy old data
-    if args.date:
+    if args.date or args.date_from:
+        copied = True
         try:
-            copy(args)
+            for state in stations:
+                with state:
+                    # A failing station does not stop copying the others
+                    try:
+                        copied = copy(state.settings) and copied
+                    except KeyboardInterrupt:
+                        raise
+                    except Exception as exp:
+                        logging.error(exp)
+                        copied = False
         except KeyboardInterrupt:
             sys.exit(1)
-        except Exception as exp:
-            logging.error(exp)
-        sys.exit()
+        finally:
+            notify.close_all()
+        transport.get_transport().log_stats()
+        sys.exit(0 if copied else 1)
     elif args.upload_csv:
         try: 
             copy_csv(args)
         except Exception as exp:
             logging.error(exp)
             sys.exit(1)
+        finally:
+            notify.close_all()
 
-    startTime = datetime.now()
-
-    while True:
-        currentTime = datetime.now()
+    # Format the CSV values according to the locale
+    if any(state.settings.csv for state in stations):
+        try:
+            locale.setlocale(locale.LC_ALL, locale.getlocale())
+        except locale.Error as exp:
+            logging.warning("Failed to set the locale for the CSV file: {}".format(exp))
+
+    if args.replay:
+        from gw2pvo import replay
+        job = replay.Replay(args.replay, args.replay_speed, (args.pvo_interval or 5) * 60)
+        if pvo_outbox:
+            # Readings of an old trace are not expired
+            pvo_outbox.clock = job.clock
         try:
-            run_once(args, city)
+            job.run(stations, lambda state: run_station(state, None), station_key)
         except KeyboardInterrupt:
             sys.exit(1)
-        except Exception as exp:
-            errorMsg = ("Failed to publish data PVOutput - " + str(exp))
-            logging.error(str(currentTime) + " - " + str(errorMsg))
+        finally:
+            gw_csv.close_all()
+            notify.close_all()
+        sys.exit()
+
+    if args.record:
+        trace.start_recording(args.record)
+
+    # Poll the stations concurrently, but never more than --max-workers at once
+    if len(stations) > 1:
+        executor = ThreadPoolExecutor(max_workers=min(args.max_workers, len(stations)))
+    else:
+        executor = None
+
+    # Run right away, then on each boundary of the --pvo-interval of a station
+    if args.pvo_interval:
+        scheduler = schedule.Scheduler(functools.reduce(math.gcd, [ state.settings.pvo_interval * 60 for state in stations ]))
+    else:
+        scheduler = None
+    start = time.monotonic()
+    due = stations
+
+    try:
+        while True:
             try:
-                telegram_notify(args.telegram_token, args.telegram_chatid, errorMsg)
-            except Exception as exp:
-                logging.error(str(currentTime) + " - Failed to send telegram notification - " + str(exp))
+                run_stations(due, city, executor, start)
+            except KeyboardInterrupt:
+                sys.exit(1)
+
+            transport.get_transport().log_stats()
 
-        if args.pvo_interval is None:
-            break
+            if scheduler is None:
+                break
 
-        interval = args.pvo_interval * 60
-        time.sleep(interval - (datetime.now() - startTime).seconds % interval)
+            try:
+                # Sleep through the night, until the first station polls again
+                start = scheduler.wait(resume_time(stations, city, scheduler.upcoming()))
+                due = [ state for state in stations if scheduler.due(start, state.settings.pvo_interval * 60) ]
+            except KeyboardInterrupt:
+                sys.exit(1)
+    finally:
+        gw_csv.close_all()
+        trace.stop_recording()
+        notify.close_all()
 
 if __name__ == "__main__":
     run()
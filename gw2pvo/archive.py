@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import threading
+
+from datetime import datetime
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+COLUMNS = (
+    'pgrid_w',
+    'load',
+    'eday_kwh',
+    'energy_used',
+    'temperature',
+    'grid_voltage',
+    'pv_voltage',
+)
+
+class Archive:
+    ''' Local history of all readings, both live and copied, per station.
+
+    Readings are stored in SQLite keyed by station and time (epoch seconds),
+    so a range of readings is an index lookup. A reading stored again for
+    the same time replaces the previous one. '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(filename, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS readings (
+                station TEXT NOT NULL,
+                timestamp INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                pgrid_w REAL,
+                load REAL,
+                eday_kwh REAL,
+                energy_used REAL,
+                temperature REAL,
+                grid_voltage REAL,
+                pv_voltage REAL,
+                PRIMARY KEY (station, timestamp)
+            ) WITHOUT ROWID""")
+        self.insert = "INSERT OR REPLACE INTO readings (station, timestamp, source, {}) VALUES (?, ?, ?, {})".format(
+            ", ".join(COLUMNS), ", ".join("?" * len(COLUMNS)))
+
+    def add(self, station, timestamp, reading, source='live'):
+        ''' Store a reading of getCurrentReadings. '''
+        values = [ reading.get(column) for column in COLUMNS ]
+        with self.lock:
+            self.db.execute(self.insert, [ str(station), int(timestamp), source ] + values)
+
+    def add_day(self, station, entries, source='sems'):
+        ''' Store the DayReadings of getDayReadings. '''
+        timestamps = [ dt.timestamp() for dt in entries.dt.astype(datetime).tolist() ]
+        rows = zip(
+            timestamps,
+            entries.pgrid_w.tolist(),
+            entries.load.tolist(),
+            entries.eday_kwh.tolist(),
+            entries.energy_used.tolist(),
+        )
+        with self.lock, self.db:
+            # The connection is in autocommit mode, insert the day in one transaction
+            self.db.execute("BEGIN")
+            self.db.executemany(self.insert, (
+                (str(station), int(timestamp), source, pgrid_w, load, eday_kwh, energy_used, None, None, None)
+                for timestamp, pgrid_w, load, eday_kwh, energy_used in rows
+            ))
+
+    def rows(self, station, start, end):
+        ''' Readings with start <= time < end (epoch seconds), oldest first, as dicts with a 'time'. '''
+        with self.lock:
+            cursor = self.db.execute(
+                "SELECT timestamp, {} FROM readings WHERE station = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp".format(", ".join(COLUMNS)),
+                (str(station), int(start), int(end)))
+            rows = cursor.fetchall()
+        return [ dict(zip(('time',) + COLUMNS, row)) for row in rows ]
+
+    def day_readings(self, station, start, end):
+        ''' The readings with start <= time < end as DayReadings. '''
+        import numpy as np
+        from gw2pvo.day_readings import DayReadings
+
+        rows = self.rows(station, start, end)
+        return DayReadings(
+            np.array([ datetime.fromtimestamp(row['time']) for row in rows ], dtype='datetime64[s]'),
+            np.array([ row['pgrid_w'] or 0 for row in rows ]),
+            np.array([ row['load'] or 0 for row in rows ]),
+            np.array([ row['eday_kwh'] or 0 for row in rows ], dtype=float),
+            np.array([ row['energy_used'] or 0 for row in rows ], dtype=float),
+        )
+
+    def csv_rows(self, station, start, end, pv_voltage=False):
+        ''' The readings with start <= time < end as rows of a --csv file, for the CSV uploader. '''
+        for row in self.rows(station, start, end):
+            voltage = row['pv_voltage'] if pv_voltage else row['grid_voltage']
+            yield {
+                'date' : datetime.fromtimestamp(row['time']).strftime('%Y-%m-%d %H:%M'),
+                'eday_kwh' : row['eday_kwh'] or 0,
+                'pgrid_w' : round(row['pgrid_w'] or 0),
+                'energy_used' : row['energy_used'] or 0,
+                'load' : round(row['load'] or 0),
+                'temp' : '' if row['temperature'] is None else row['temperature'],
+                'voltage' : '' if voltage is None else round(voltage, 1),
+            }
+
+    def daily(self, station, start, end):
+        ''' Per local day with start <= time < end: the energy totals, peak power and temperature range. '''
+        with self.lock:
+            cursor = self.db.execute("""
+                SELECT date(timestamp, 'unixepoch', 'localtime') AS day,
+                    COUNT(*), MAX(eday_kwh), MAX(energy_used), MAX(pgrid_w), AVG(load), MIN(temperature), MAX(temperature)
+                FROM readings WHERE station = ? AND timestamp >= ? AND timestamp < ?
+                GROUP BY day ORDER BY day""", (str(station), int(start), int(end)))
+            rows = cursor.fetchall()
+        return [
+            dict(zip(('date', 'readings', 'eday_kwh', 'energy_used', 'peak_w', 'average_load', 'temperature_min', 'temperature_max'), row))
+            for row in rows
+        ]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
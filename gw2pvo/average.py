@@ -1,4 +1,6 @@
-import logging
+import math
+
+import numpy as np
 
 __author__ = "Mark Ruys"
 __copyright__ = "Copyright 2017, Mark Ruys"
@@ -6,25 +8,105 @@ __license__ = "MIT"
 __email__ = "mark@paracas.nl"
 
 class MovingAverage:
+    ''' Linearly weighted moving average over the last n samples, the most
+    recent sample weighing n times as much as the oldest one.
+
+    The window is a fixed size ring buffer, so add() takes constant time. '''
 
     def __init__(self, n):
         self.n = round(n) if n > 0 else 1
         self.denominator = self.n * (self.n + 1) / 2
-        self.queue = []
+        self.weights = np.arange(1, self.n + 1)
+        self.queue = None
+
+    def fill(self, x):
+        self.queue = [x] * self.n
+        self.head = 0
+        self.total = x * self.n
+        self.numerator = x * self.denominator
 
     def add(self, x):
 
-        if len(self.queue) == 0:
-            self.queue = [x] * self.n
-            self.total = sum(self.queue)
-            self.numerator = x * self.denominator
+        if self.queue is None:
+            self.fill(x)
 
         self.numerator += self.n * x - self.total
 
-        self.total += x - self.queue[0]
-
-        self.queue.append(x)
-        self.queue = self.queue[-self.n:]
+        # queue[head] is the oldest sample, replace it by the new one
+        self.total += x - self.queue[self.head]
+        self.queue[self.head] = x
+        self.head = (self.head + 1) % self.n
 
         return self.numerator / self.denominator
 
+    def window(self):
+        ''' The samples in the window, oldest first. '''
+        return self.queue[self.head:] + self.queue[:self.head]
+
+    def add_many(self, xs):
+        ''' add() each of xs, returning an array of the averages. '''
+        xs = np.asarray(xs, dtype=float)
+        if len(xs) == 0:
+            return xs
+        if self.queue is None:
+            self.fill(xs[0].item())
+
+        history = np.concatenate((self.window(), xs))
+        averages = np.correlate(history[1:], self.weights, 'valid') / self.denominator
+
+        tail = history[-self.n:]
+        self.queue = tail.tolist()
+        self.head = 0
+        self.total = tail.sum().item()
+        self.numerator = averages[-1].item() * self.denominator
+        return averages
+
+class ExponentialMovingAverage:
+    ''' Exponential moving average with the same smoothing as an n sample
+    simple moving average (alpha = 2 / (n + 1)). '''
+
+    def __init__(self, n):
+        self.n = round(n) if n > 0 else 1
+        self.alpha = 2 / (self.n + 1)
+        self.value = None
+
+    def add(self, x):
+        if self.value is None:
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+    def add_many(self, xs):
+        ''' add() each of xs, returning an array of the averages. '''
+        xs = np.asarray(xs, dtype=float)
+        if len(xs) == 0:
+            return xs
+        if self.alpha == 1:
+            # A window of one sample, nothing to smooth
+            self.value = xs[-1].item()
+            return xs.copy()
+        if self.value is None:
+            self.value = xs[0].item()
+
+        # Closed form y[i] = d^(i+1) y[-1] + alpha * sum(d^(i-k) x[k]), evaluated
+        # in blocks short enough for d^-k to stay well within float range
+        decay = 1 - self.alpha
+        block = max(1, int(100 / -math.log10(decay)))
+        averages = np.empty(len(xs))
+        for start in range(0, len(xs), block):
+            chunk = xs[start:start + block]
+            powers = decay ** np.arange(1, len(chunk) + 1)
+            sums = np.cumsum(chunk / powers)
+            averages[start:start + len(chunk)] = powers * (self.value + self.alpha * sums)
+            self.value = averages[start + len(chunk) - 1].item()
+        return averages
+
+SMOOTHING = {
+    'wma' : MovingAverage,
+    'ema' : ExponentialMovingAverage,
+}
+
+def smoother(kind, n):
+    ''' A moving average of the given kind ('wma' or 'ema') over n samples. '''
+    return SMOOTHING[kind](n)
@@ -0,0 +1,96 @@
+import logging
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+def date_range(first, last):
+    ''' All dates from first up to and including last. '''
+    days = (last - first).days
+    if days < 0:
+        raise ValueError("End date {:%Y-%m-%d} is before start date {:%Y-%m-%d}".format(last, first))
+    return [ first + timedelta(days=i) for i in range(days + 1) ]
+
+class Backfill:
+    ''' Copy a range of days from SEMS to PVOutput.
+
+    Days are downloaded on a thread pool while the days that are already
+    complete are uploaded, so the SEMS and PVOutput round-trips overlap. '''
+
+    def __init__(self, goodwe, pvo, get_temperatures=None, workers=4, prepare=None, store=None):
+        self.goodwe = goodwe
+        self.pvo = pvo
+        self.get_temperatures = get_temperatures
+        self.workers = max(workers, 1)
+        self.prepare = prepare
+        self.store = store
+
+    def fetch(self, date):
+        start = time.monotonic()
+        data = self.goodwe.getDayReadings(date)
+        if self.store:
+            self.store(data['entries'])
+        if self.prepare:
+            data['entries'] = self.prepare(data['entries'])
+        temperatures = None
+        if self.pvo and self.get_temperatures:
+            temperatures = self.get_temperatures(data, date)
+        return data, temperatures, time.monotonic() - start
+
+    def upload(self, data, temperatures):
+        if self.pvo:
+            if not self.pvo.add_day(data['entries'], temperatures):
+                raise Exception("PVOutput did not accept all readings")
+        else:
+            for entry in data['entries']:
+                logging.info("{}: {:6.0f} W {:6.2f} kWh".format(
+                    entry['dt'],
+                    entry['pgrid_w'],
+                    entry['eday_kwh'],
+                ))
+
+    def run(self, dates):
+        start = time.monotonic()
+        readings = 0
+        done = 0
+        failed = 0
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(dates))) as executor:
+            futures = { executor.submit(self.fetch, date) : date for date in dates }
+            for future in as_completed(futures):
+                date = futures[future]
+                try:
+                    data, temperatures, fetch_time = future.result()
+                    upload_start = time.monotonic()
+                    self.upload(data, temperatures)
+                    upload_time = time.monotonic() - upload_start
+                except Exception as exp:
+                    failed += 1
+                    logging.error("{:%Y-%m-%d}: failed to copy readings - {}".format(date, exp))
+                    continue
+
+                done += 1
+                readings += len(data['entries'])
+                logging.info("{:%Y-%m-%d}: {} readings, fetched in {:.1f} s, uploaded in {:.1f} s ({}/{} days)".format(
+                    date,
+                    len(data['entries']),
+                    fetch_time,
+                    upload_time,
+                    done + failed,
+                    len(dates),
+                ))
+
+        elapsed = time.monotonic() - start
+        logging.info("Copied {} readings of {} days in {:.1f} s ({:.1f} readings/s, {} days failed)".format(
+            readings,
+            done,
+            elapsed,
+            readings / elapsed if elapsed > 0 else 0,
+            failed,
+        ))
+        return failed == 0
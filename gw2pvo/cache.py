@@ -0,0 +1,45 @@
+import os
+import json
+import logging
+import tempfile
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+def cache_dir():
+    ''' Directory for state kept between runs, honouring XDG_CACHE_HOME. '''
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'gw2pvo')
+
+def cache_file(name):
+    return os.path.join(cache_dir(), name)
+
+def read_json(filename, default=None):
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError) as exp:
+        logging.warning("Ignoring unreadable cache file {}: {}".format(filename, exp))
+        return default
+
+def write_json(filename, data):
+    ''' Write JSON atomically, so a concurrent reader never sees a partial file. '''
+    directory = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(filename), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, filename)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
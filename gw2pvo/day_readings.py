@@ -0,0 +1,126 @@
+from collections.abc import Sequence
+from datetime import datetime
+
+import numpy as np
+
+from gw2pvo.average import smoother
+from gw2pvo.resample import resample
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+class DayReadings(Sequence):
+    ''' The readings of one day, stored as NumPy columns.
+
+    Indexing gives the same dicts getDayReadings used to return ('dt',
+    'pgrid_w', 'load', 'eday_kwh', 'energy_used'), slicing gives another
+    DayReadings without copying the columns. '''
+
+    def __init__(self, dt, pgrid_w, load, eday_kwh, energy_used):
+        self.dt = dt
+        self.pgrid_w = pgrid_w
+        self.load = load
+        self.eday_kwh = eday_kwh
+        self.energy_used = energy_used
+
+    @classmethod
+    def from_sems(cls, pacs, xy, energy_used=0):
+        ''' Integrate the SEMS power (pacs) and load (xy) samples of a day into energy totals.
+
+        Samples with a negative power are left out, and the consumption is
+        scaled to match energy_used, the day total SEMS reports, if known. '''
+        n = min(len(pacs), len(xy))
+        dt = parse_dates([ p['date'] for p in pacs[:n] ])
+        pgrid_w = np.array([ p['pac'] for p in pacs[:n] ])
+        load = np.array([ x['y'] for x in xy[:n] ])
+        if n == 0:
+            return cls(dt, pgrid_w, load, np.zeros(0), np.zeros(0))
+
+        # Hours since midnight at minute resolution, like the SEMS charts
+        minutes = (dt - dt.astype('datetime64[D]')).astype('timedelta64[m]').astype(np.int64)
+        duration = np.diff(minutes // 60 + (minutes % 60) / 60, prepend=0.0)
+
+        valid = pgrid_w >= 0
+        kwh = np.cumsum(np.where(valid, pgrid_w / 1000 * duration, 0))[valid]
+        c_kwh = np.cumsum(np.where(valid, load / 1000 * duration, 0))[valid]
+
+        consumption = np.round(c_kwh, 3)
+        if energy_used > 0 and len(c_kwh) > 0 and c_kwh[-1] > 0:
+            consumption = consumption * (energy_used / c_kwh[-1])
+
+        return cls(dt[valid], pgrid_w[valid], load[valid], np.round(kwh, 3), consumption)
+
+    def resample(self, interval):
+        ''' These readings on an interval grid (in seconds), with the average power
+        and load, and the energy totals at the end of each bucket. '''
+        # The naive local times are treated as UTC, which keeps the grid aligned to local time
+        timestamps = self.dt.astype('datetime64[s]').astype(np.int64)
+        buckets = resample(timestamps, interval,
+            mean={ 'pgrid_w' : self.pgrid_w, 'load' : self.load },
+            last={ 'eday_kwh' : self.eday_kwh, 'energy_used' : self.energy_used })
+        return DayReadings(
+            buckets['time'].astype(np.int64).astype('datetime64[s]'),
+            np.round(buckets['pgrid_w']).astype(np.int64),
+            np.round(buckets['load']).astype(np.int64),
+            buckets['eday_kwh'],
+            buckets['energy_used'],
+        )
+
+    def smooth(self, kind, n):
+        ''' These readings with a moving average ('wma' or 'ema') over n readings of the power and load. '''
+        return DayReadings(
+            self.dt,
+            np.round(smoother(kind, n).add_many(self.pgrid_w)).astype(np.int64),
+            np.round(smoother(kind, n).add_many(self.load)).astype(np.int64),
+            self.eday_kwh,
+            self.energy_used,
+        )
+
+    def __len__(self):
+        return len(self.dt)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return DayReadings(
+                self.dt[index],
+                self.pgrid_w[index],
+                self.load[index],
+                self.eday_kwh[index],
+                self.energy_used[index],
+            )
+        return {
+            'dt' : self.dt[index].astype(datetime),
+            'pgrid_w' : self.pgrid_w[index].item(),
+            'load' : self.load[index].item(),
+            'eday_kwh' : self.eday_kwh[index].item(),
+            'energy_used' : self.energy_used[index].item(),
+        }
+
+    def __iter__(self):
+        # Convert each column once instead of every value on its own
+        columns = zip(
+            self.dt.astype(datetime).tolist(),
+            self.pgrid_w.tolist(),
+            self.load.tolist(),
+            self.eday_kwh.tolist(),
+            self.energy_used.tolist(),
+        )
+        for dt, pgrid_w, load, eday_kwh, energy_used in columns:
+            yield {
+                'dt' : dt,
+                'pgrid_w' : pgrid_w,
+                'load' : load,
+                'eday_kwh' : eday_kwh,
+                'energy_used' : energy_used,
+            }
+
+def parse_dates(dates):
+    ''' Parse SEMS "%m/%d/%Y %H:%M:%S" dates into a datetime64 array. '''
+    try:
+        # Rearrange into ISO 8601, which NumPy parses natively
+        return np.array([ d[6:10] + '-' + d[0:2] + '-' + d[3:5] + 'T' + d[11:19] for d in dates ], dtype='datetime64[s]')
+    except ValueError:
+        # Not zero padded
+        return np.array([ datetime.strptime(d, "%m/%d/%Y %H:%M:%S") for d in dates ], dtype='datetime64[s]')
@@ -3,14 +3,19 @@ import logging
 import time
 import requests
 
+from gw2pvo import metrics
+from gw2pvo import station
+from gw2pvo.transport import get_transport
+
 __author__ = "Michaël Hompus"
 __copyright__ = "Copyright 2018, Michaël Hompus"
 __license__ = "MIT"
 __email__ = "michael@hompus.nl"
 
 class DarkSkyApi:
-    def __init__(self, api_key):
+    def __init__(self, api_key, transport=None):
         self.api_key = api_key
+        self.transport = transport or get_transport()
 
     def get_temperature(self, latitude, longitude):
         if latitude is None or longitude is None:
@@ -26,13 +31,15 @@ class DarkSkyApi:
 
         for i in range(1, 4):
             try:
-                r = requests.get(url, timeout=10)
+                with metrics.WEATHER_REQUEST_SECONDS.time(service='darksky'):
+                    r = self.transport.get(url)
                 r.raise_for_status()
                 result = r.json()
 
                 return result['currently']['temperature']
             except requests.exceptions.RequestException as arg:
                 logging.warning(arg)
+                metrics.RETRIES.inc(service='darksky', station=station.current())
             time.sleep(i ** 3)
         else:
             logging.error("Failed to call DarkSky API")
@@ -52,13 +59,15 @@ class DarkSkyApi:
 
         for i in range(1, 4):
             try:
-                r = requests.get(url, timeout=10)
+                with metrics.WEATHER_REQUEST_SECONDS.time(service='darksky'):
+                    r = self.transport.get(url)
                 r.raise_for_status()
                 result = r.json()
 
                 return result['hourly']['data']
             except requests.exceptions.RequestException as arg:
                 logging.warning(arg)
+                metrics.RETRIES.inc(service='darksky', station=station.current())
             time.sleep(i ** 3)
         else:
             logging.error("Failed to call DarkSky API")
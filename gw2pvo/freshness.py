@@ -0,0 +1,89 @@
+import collections
+import logging
+import statistics
+import threading
+
+from gw2pvo import cache
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+# Readings the cadence is learned from
+HISTORY = 8
+
+# Seconds to poll after a new reading is expected
+MARGIN = 15
+
+class Freshness:
+    ''' Learn how often a station gets a new reading.
+
+    update() is given the time a reading was taken, as reported by the
+    source, and the time it was received. The cadence is the median time
+    between recent readings. The delay is the shortest time between taking
+    and receiving a recent reading, which also absorbs a difference in
+    time zone. Together they tell when the next reading can be expected. '''
+
+    def __init__(self, taken=(), delays=()):
+        self.taken = collections.deque(taken, maxlen=HISTORY + 1)
+        self.delays = collections.deque(delays, maxlen=HISTORY + 1)
+
+    def update(self, taken, received):
+        ''' Add a reading, return whether it is a new one. '''
+        if self.taken and taken <= self.taken[-1]:
+            return False
+        self.taken.append(taken)
+        self.delays.append(received - taken)
+        return True
+
+    def cadence(self):
+        ''' Median seconds between readings, None until a few were seen. '''
+        if len(self.taken) < 3:
+            return None
+        times = list(self.taken)
+        return statistics.median(b - a for a, b in zip(times, times[1:]))
+
+    def expected(self):
+        ''' When the next reading can be received, None if unknown. '''
+        cadence = self.cadence()
+        if cadence is None:
+            return None
+        return self.taken[-1] + cadence + min(self.delays)
+
+class FreshnessStore:
+    ''' The Freshness of each station. With a filename it is kept between
+    cron runs, like SessionStore. '''
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.stations = {}
+        if filename:
+            data = cache.read_json(filename, {})
+            for station, state in (data.items() if isinstance(data, dict) else []):
+                self.stations[station] = Freshness(state.get('taken', ()), state.get('delays', ()))
+
+    def get(self, station):
+        with self.lock:
+            if station not in self.stations:
+                self.stations[station] = Freshness()
+            return self.stations[station]
+
+    def update(self, station, taken, received):
+        ''' Add a reading of station, return whether it is a new one. '''
+        freshness = self.get(station)
+        with self.lock:
+            if not freshness.update(taken, received):
+                return False
+            data = { key : { 'taken' : list(f.taken), 'delays' : list(f.delays) } for key, f in self.stations.items() }
+        self.save(data)
+        return True
+
+    def save(self, data):
+        if not self.filename:
+            return
+        try:
+            cache.write_json(self.filename, data)
+        except OSError as exp:
+            logging.warning("Failed to save the SEMS freshness to {}: {}".format(self.filename, exp))
@@ -1,23 +1,54 @@
 import json
 import logging
 import time
-from datetime import datetime, timedelta
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
 import requests
 
+from gw2pvo import metrics
+from gw2pvo import station
+from gw2pvo import trace
+from gw2pvo.transport import get_transport
+
 __author__ = "Mark Ruys"
 __copyright__ = "Copyright 2017, Mark Ruys"
 __license__ = "MIT"
 __email__ = "mark@paracas.nl"
 
+GLOBAL_URL = 'https://semsportal.com/api/'
+
+# The token before logging in
+ANONYMOUS_TOKEN = '{"version":"v3.1","client":"ios","language":"en"}'
+
+# Location, capacity and inverters of a station are refreshed weekly
+STATION_INFO_MAX_AGE = 7 * 86400
+
+# Enough for one call to exhaust its retries
+DAY_READINGS_TIMEOUT = 90
+
 class GoodWeApi:
 
-    def __init__(self, system_id, account, password):
+    def __init__(self, system_id, account, password, session_store=None, transport=None, global_url=None, deadline=None):
         self.system_id = system_id
         self.account = account
         self.password = password
-        self.token = '{"version":"v3.1","client":"ios","language":"en"}'
-        self.global_url = 'https://semsportal.com/api/'
+        self.token = ANONYMOUS_TOKEN
+        self.global_url = global_url or GLOBAL_URL
         self.base_url = self.global_url
+        self.session_store = session_store
+        self.transport = transport or get_transport()
+        self.login_lock = threading.Lock()
+        self.station_info = None
+        # No more retries after this time.monotonic()
+        self.deadline = deadline
+
+        # Reuse the regional url and token of an earlier login until SEMS rejects them
+        if session_store:
+            session = session_store.get(account)
+            if session:
+                self.base_url = session['base_url']
+                self.token = session['token']
 
     def statusText(self, status):
         labels = { -1 : 'Offline', 0 : 'Waiting', 1 : 'Normal', 2: 'Fault' }
@@ -40,6 +71,9 @@ class GoodWeApi:
             'powerStationId' : self.system_id
         }
         data = self.call("v2/PowerStation/GetMonitorDetailByPowerstationId", payload)
+        trace.record('sems', self.system_id, data)
+        self.setStationInfo(self.parseStationInfo(data))
+        taken = self.parseTime(data['info'].get('time'))
 
         result = {
             'status' : 'Unknown',
@@ -55,7 +89,9 @@ class GoodWeApi:
             'meter' : 0,
             'energy_used' : 0,
             'latitude' : data['info'].get('latitude'),
-            'longitude' : data['info'].get('longitude')
+            'longitude' : data['info'].get('longitude'),
+            'date' : taken.strftime('%Y-%m-%d %H:%M'),
+            'taken' : taken.timestamp(),
         }
 
         count = 0
@@ -126,11 +162,30 @@ class GoodWeApi:
         data = self.call("v2/Charts/GetChartByPlant", payload)
         if 'modelData' not in data:
             logging.warning("GetChartByPlant returned bad data :" + str(data))
-            return []
+            return 0
 
         return data['modelData']['consumptionOfLoad']
 
-    def getLocation(self):
+    def parseStationInfo(self, data):
+        return {
+            'latitude' : data['info'].get('latitude'),
+            'longitude' : data['info'].get('longitude'),
+            'capacity' : data['info'].get('capacity'),
+            'inverters' : [ inverter.get('sn') for inverter in data.get('inverter', []) ],
+        }
+
+    def setStationInfo(self, info):
+        self.station_info = info
+        if self.session_store:
+            self.session_store.set_station(self.system_id, info)
+
+    def getStationInfo(self):
+        ''' Location, capacity and inverter serials, from cache when known. '''
+        if self.station_info is None and self.session_store:
+            self.station_info = self.session_store.get_station(self.system_id, STATION_INFO_MAX_AGE)
+        if self.station_info is not None:
+            return self.station_info
+
         payload = {
             'powerStationId' : self.system_id
         }
@@ -139,9 +194,17 @@ class GoodWeApi:
             logging.warning("GetMonitorDetailByPowerstationId returned bad data: " + str(data))
             return {}
 
+        self.setStationInfo(self.parseStationInfo(data))
+        return self.station_info
+
+    def getLocation(self):
+        info = self.getStationInfo()
+        if not info:
+            return {}
+
         return {
-            'latitude' : data['info'].get('latitude'),
-            'longitude' : data['info'].get('longitude'),
+            'latitude' : info.get('latitude'),
+            'longitude' : info.get('longitude'),
         }
 
     def getDayPac(self, date):
@@ -171,41 +234,35 @@ class GoodWeApi:
 
         return data['lines'][3]['xy']
 
-    def getDayReadings(self, date):
-        result = self.getLocation()
-        pacs = self.getDayPac(date)
-        xy = self.getDayLoad(date, 1)
-
-        hours = 0
-        kwh = 0
-        c_kwh = 0
-        result['entries'] = []
-        for p, x in zip(pacs, xy):
-            parsed_date = datetime.strptime(p['date'], "%m/%d/%Y %H:%M:%S")
-            next_hours = parsed_date.hour + parsed_date.minute / 60
-            pgrid_w = p['pac']
-            load = x['y']
-            if pgrid_w >= 0:
-                kwh += pgrid_w / 1000 * (next_hours - hours)
-                c_kwh += load /1000 * (next_hours - hours)
-                result['entries'].append({
-                    'dt' : parsed_date,
-                    'pgrid_w': pgrid_w,
-                    'load': load,
-                    'eday_kwh': round(kwh, 3),
-                    'energy_used' : round(c_kwh, 3)
-                })
-            hours = next_hours
-        energy_used = self.getActualConsumption(date, 7)
-        if energy_used > 0:
-            correction = energy_used / c_kwh
-            for sample in result['entries']:
-                sample['energy_used'] *= correction
+    def getDayReadings(self, date, timeout=DAY_READINGS_TIMEOUT):
+        # NumPy is only loaded by the backfill, not by every cron run
+        from gw2pvo.day_readings import DayReadings
+
+        # The calls are independent, so fetch them at the same time
+        executor = ThreadPoolExecutor(max_workers=4)
+        location = executor.submit(self.getLocation)
+        day_pac = executor.submit(self.getDayPac, date)
+        day_load = executor.submit(self.getDayLoad, date, 1)
+        consumption = executor.submit(self.getActualConsumption, date, 7)
+        executor.shutdown(wait=False)
+
+        done, pending = wait([location, day_pac, day_load, consumption], timeout=timeout)
+        if pending:
+            raise Exception("Failed to fetch readings of {:%Y-%m-%d} from GoodWe API within {} seconds".format(date, timeout))
+
+        result = location.result()
+        pacs = day_pac.result()
+        xy = day_load.result()
+        energy_used = consumption.result()
+
+        result['entries'] = DayReadings.from_sems(pacs, xy, energy_used)
 
         return result
 
     def call(self, url, payload):
+        relogin = False
         for i in range(1, 4):
+            base_url = self.base_url
             try:
                 headers = {
                     'User-Agent': 'SEMS Portal/3.1 (iPhone; iOS 13.5.1; Scale/2.00)',
@@ -213,7 +270,13 @@ class GoodWeApi:
                     'ContentLength': str(250)
                 }
 
-                r = requests.post(self.base_url + url, headers=headers, data=payload, timeout=10)
+                if relogin:
+                    self.login(headers)
+                    headers['Token'] = self.token
+                    relogin = False
+
+                with metrics.SEMS_REQUEST_SECONDS.time(endpoint=url.split('/')[-1], station=station.current()):
+                    r = self.transport.post(self.base_url + url, headers=headers, data=payload)
                 r.raise_for_status()
                 data = r.json()
                 logging.debug(data)
@@ -226,27 +289,67 @@ class GoodWeApi:
                 if code == 0 and data['data'] is not None:
                     return data['data']
                 elif code == 100001:
-                    loginPayload = {
-                        'account': self.account,
-                        'pwd': self.password,
-                    }
-                    r = requests.post(self.global_url + 'v2/Common/CrossLogin', headers=headers, data=loginPayload, timeout=10)
-                    r.raise_for_status()
-                    data = r.json()
-                    if 'api' not in data:
-                        raise Exception(data['msg'])
-                    self.base_url = data['api']
-                    self.token = json.dumps(data['data'])
+                    self.login(headers)
+                    continue
                 else:
                     raise Exception("Failed to call GoodWe API (code {})".format(code))
             except requests.exceptions.RequestException as exp:
                 logging.warning(exp)
+                metrics.RETRIES.inc(service='sems', station=station.current())
+                # The regional server of a cached login may be gone, log in again through the global one
+                if base_url != self.global_url:
+                    relogin = self.forget_session(base_url)
+            if self.deadline is not None and time.monotonic() + i ** 3 > self.deadline:
+                raise Exception("Failed to call GoodWe API (deadline passed)")
             time.sleep(i ** 3)
         else:
             raise Exception("Failed to call GoodWe API (too many retries)")
 
         return {}
 
+    def login(self, headers):
+        # Concurrent calls may all get rejected, only the first one needs to log in again
+        with self.login_lock:
+            if self.token != headers['Token']:
+                return
+            loginPayload = {
+                'account': self.account,
+                'pwd': self.password,
+            }
+            metrics.SEMS_LOGINS.inc(station=station.current())
+            with metrics.SEMS_REQUEST_SECONDS.time(endpoint='CrossLogin', station=station.current()):
+                r = self.transport.post(self.global_url + 'v2/Common/CrossLogin', headers=headers, data=loginPayload)
+            r.raise_for_status()
+            data = r.json()
+            if 'api' not in data:
+                if self.session_store:
+                    self.session_store.forget(self.account)
+                raise Exception(data['msg'])
+            self.base_url = data['api']
+            self.token = json.dumps(data['data'])
+            if self.session_store:
+                self.session_store.set(self.account, self.base_url, self.token)
+            logging.debug("Logged in to SEMS, using " + self.base_url)
+
+    def forget_session(self, base_url):
+        ''' Drop the login at base_url, return False if another call already did. '''
+        with self.login_lock:
+            if self.base_url != base_url:
+                return False
+            logging.info("Forgetting the SEMS login at " + base_url)
+            if self.session_store:
+                self.session_store.forget(self.account)
+            self.base_url = self.global_url
+            self.token = ANONYMOUS_TOKEN
+            return True
+
+    def parseTime(self, value):
+        ''' The time SEMS reports a reading was taken, or now if it is unknown. '''
+        try:
+            return datetime.strptime(value, '%m/%d/%Y %H:%M:%S')
+        except (TypeError, ValueError):
+            return datetime.now()
+
     def parseValue(self, value, unit):
         try:
             return float(value.rstrip(unit))
@@ -1,6 +1,9 @@
 import logging
 import datetime
 import csv
+import os
+import threading
+import time
 
 __author__ = "Mark Ruys"
 __copyright__ = "Copyright 2017, Mark Ruys"
@@ -8,23 +11,78 @@ __license__ = "MIT"
 __email__ = "mark@paracas.nl"
 
 class GoodWeCSV:
+    ''' Append readings to a CSV file which is kept open between readings.
 
-    def __init__(self, filename):
-        self.filename = filename.replace('DATE', datetime.date.today().isoformat())
+    Rows are buffered, a timer writes them out at most flush_interval
+    seconds after they were added, even when no more rows follow. DATE in
+    the filename is replaced by the current date, and at midnight the
+    writer moves on to the file of the new day. The file is only fsynced
+    when it is rotated or closed, close_all() has to be called on exit. '''
+
+    def __init__(self, filename, flush_interval=60):
+        self.template = filename
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.file = None
+        self.filename = None
+        self.day = None
+        self.last_flush = 0
+        self.timer = None
+
+    def open(self, day):
+        self.day = day
+        self.filename = self.template.replace('DATE', day.isoformat())
+        self.file = open(self.filename, 'a', newline='')
+        self.writer = csv.writer(self.file, dialect='excel', delimiter=',')
+        if self.file.tell() == 0:
+            self.file.write('\ufeff') # Add UTF-8 BOM header
+            self.writer.writerow([self.label(field) for field in self.order()])
+        self.last_flush = time.monotonic()
 
     def append(self, data):
         ''' Append a row to the CSV file. '''
-        try:
-            with open(self.filename, 'x', newline='') as csvfile:
-                csvfile.write('\ufeff') # Add UTF-8 BOM header
-                csvwriter = csv.writer(csvfile, dialect='excel', delimiter=',')
-                csvwriter.writerow([self.label(field) for field in self.order()])
-        except:
-            pass
-
-        with open(self.filename, 'a', newline='') as csvfile:
-            csvwriter = csv.writer(csvfile, dialect='excel', delimiter=',')
-            csvwriter.writerow([data[field] for field in self.order()])
+        with self.lock:
+            today = datetime.date.today()
+            if self.file is not None and today != self.day and 'DATE' in self.template:
+                logging.debug("Rotating CSV file {}".format(self.filename))
+                self.sync()
+            if self.file is None:
+                self.open(today)
+
+            self.writer.writerow([data.get(field, '') for field in self.order()])
+            delay = self.last_flush + self.flush_interval - time.monotonic()
+            if delay <= 0:
+                self.flush_file()
+            elif self.timer is None:
+                self.timer = threading.Timer(delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        ''' Write out the buffered rows. '''
+        with self.lock:
+            self.timer = None
+            if self.file is not None:
+                self.flush_file()
+
+    def flush_file(self):
+        self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def sync(self):
+        # Write everything to disk and close the file
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+
+    def close(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.file is not None:
+                self.sync()
 
     def format_field(self, value):
         ''' Format values while respecting the locale, so Excel opens the CSV properly. '''
@@ -55,3 +113,18 @@ class GoodWeCSV:
             'temperature',
             'grid_voltage',
         ]
+
+_lock = threading.Lock()
+_writers = {}
+
+def get_writer(filename, flush_interval=60):
+    ''' The writer for a CSV file, shared by all stations appending to it. '''
+    with _lock:
+        if filename not in _writers:
+            _writers[filename] = GoodWeCSV(filename, flush_interval)
+        return _writers[filename]
+
+def close_all():
+    with _lock:
+        for writer in _writers.values():
+            writer.close()
@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+
+from gw2pvo import cache
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+class SessionStore:
+    ''' Remember the SEMS token and regional API url per account, and the
+    metadata of each station which hardly ever changes.
+
+    Without a filename the sessions only live as long as the process (daemon
+    mode). With a filename they are loaded at start and written atomically
+    after each change, so consecutive cron runs skip the CrossLogin. '''
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.stations = {}
+        if filename:
+            data = cache.read_json(filename, {})
+            if isinstance(data, dict):
+                self.sessions = data.get('sessions', {})
+                self.stations = data.get('stations', {})
+
+    def get(self, account):
+        with self.lock:
+            return self.sessions.get(account)
+
+    def set(self, account, base_url, token):
+        with self.lock:
+            self.sessions[account] = {
+                'base_url' : base_url,
+                'token' : token,
+                'login_time' : time.time(),
+            }
+            self.save()
+
+    def forget(self, account):
+        with self.lock:
+            if self.sessions.pop(account, None) is not None:
+                self.save()
+
+    def get_station(self, station_id, max_age):
+        with self.lock:
+            station = self.stations.get(station_id)
+        if station and time.time() - station['update_time'] < max_age:
+            return station['info']
+        return None
+
+    def set_station(self, station_id, info):
+        with self.lock:
+            station = self.stations.get(station_id)
+            if station and station['info'] == info and time.time() - station['update_time'] < 3600:
+                return
+            self.stations[station_id] = {
+                'info' : info,
+                'update_time' : time.time(),
+            }
+            self.save()
+
+    def save(self):
+        if not self.filename:
+            return
+        try:
+            cache.write_json(self.filename, { 'sessions' : self.sessions, 'stations' : self.stations })
+        except OSError as exp:
+            logging.warning("Failed to save SEMS session to {}: {}".format(self.filename, exp))
@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+# Request latencies of the remote services range from milliseconds to the HTTP timeout
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30, 60)
+
+_registry = []
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, escape(value)) for name, value in pairs) + '}'
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+class Metric:
+    ''' A named metric with a value per combination of label values, in the
+    Prometheus text format. '''
+
+    kind = 'untyped'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        _registry.append(self)
+
+    def key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self):
+        ''' (suffix, label values, extra labels, value) of each sample. '''
+        with self.lock:
+            return [ ('', key, (), value) for key, value in sorted(self.values.items()) ]
+
+    def render(self):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.help),
+            '# TYPE {} {}'.format(self.name, self.kind),
+        ]
+        for suffix, key, extra, value in self.samples():
+            lines.append('{}{}{} {}'.format(self.name, suffix, format_labels(self.labelnames, key, extra), format_value(value)))
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = [ [0] * len(self.buckets), 0.0, 0 ]
+            counts, total, count = self.values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key][1] = total + value
+            self.values[key][2] = count + 1
+
+    def time(self, **labels):
+        ''' Context manager observing the duration of its block. '''
+        return Timer(self, labels)
+
+    def samples(self):
+        result = []
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                for bound, cumulative in zip(self.buckets, counts):
+                    result.append(('_bucket', key, (('le', format_value(bound)),), cumulative))
+                result.append(('_sum', key, (), total))
+                result.append(('_count', key, (), count))
+        return result
+
+class Timer:
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.monotonic() - self.start, **self.labels)
+        return False
+
+def render():
+    ''' All metrics in the Prometheus text exposition format. '''
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+def serve(port, address=''):
+    ''' Serve /metrics on port from a background thread. '''
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+    # ThreadingHTTPServer needs Python 3.7
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug("Metrics: " + format % args)
+
+    server = Server((address, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info("Serving metrics on port {}".format(server.server_address[1]))
+    return server
+
+SEMS_REQUEST_SECONDS = Histogram('gw2pvo_sems_request_seconds', 'Duration of SEMS API requests', ['endpoint', 'station'])
+SEMS_LOGINS = Counter('gw2pvo_sems_logins_total', 'SEMS logins, after the token expired (code 100001)', ['station'])
+PVOUTPUT_REQUEST_SECONDS = Histogram('gw2pvo_pvoutput_request_seconds', 'Duration of PVOutput API requests', ['service'])
+PVOUTPUT_RATE_LIMIT_REMAINING = Gauge('gw2pvo_pvoutput_rate_limit_remaining', 'Requests left in the PVOutput hourly budget (X-Rate-Limit-Remaining)', ['system'])
+WEATHER_REQUEST_SECONDS = Histogram('gw2pvo_weather_request_seconds', 'Duration of weather API requests', ['service'])
+MQTT_WAIT_SECONDS = Histogram('gw2pvo_mqtt_wait_seconds', 'Time spent waiting for the MQTT readings', [])
+RETRIES = Counter('gw2pvo_retries_total', 'Failed requests that were retried', ['service', 'station'])
+SKIPPED_UPLOADS = Counter('gw2pvo_skipped_uploads_total', 'Readings not uploaded to PVOutput', ['reason', 'station'])
+CYCLE_SECONDS = Histogram('gw2pvo_cycle_seconds', 'Duration of a complete read and upload cycle', ['station'])
+CYCLE_FAILURES = Counter('gw2pvo_cycle_failures_total', 'Cycles that failed', ['station'])
+SCHEDULE_SLIP_SECONDS = Histogram('gw2pvo_schedule_slip_seconds', 'Delay between an interval boundary and the start of its cycle', [], (0.01, 0.1, 1, 5, 15, 30, 60, 120))
+SKIPPED_CYCLES = Counter('gw2pvo_skipped_cycles_total', 'Interval boundaries skipped because a cycle overran')
+STAGE_SECONDS = Histogram('gw2pvo_stage_seconds', 'Duration of the stages of a cycle', ['stage'])
+STAGE_OVERRUNS = Counter('gw2pvo_stage_overruns_total', 'Stages that finished after their deadline', ['stage'])
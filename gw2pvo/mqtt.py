@@ -1,21 +1,48 @@
-import sys, os
 import time
 import logging
-import telegram
+import threading
+import collections
 
 import paho.mqtt.client as mqtt
 
 from datetime import datetime
 
+from gw2pvo import metrics
+from gw2pvo import notify
+from gw2pvo import trace
+
 __author__ = "Jacqueco Peenz"
 __copyright__ = "Copyright 2020, Jacqueco Peenz"
 __license__ = "MIT"
 __email__ = "jakezp@gmail.com"
 __credit__ = "https://github.com/jkairys/mqtt-pvoutput-bridge"
 
+# Readings getCurrentReadings needs before it can report
+REQUIRED_KEYS = (
+    'work_mode_label',
+    'pv_daily',
+    'ppv',
+    'house_consumption_daily',
+    'house_consumption',
+    'outside_temperature',
+    'vgrid',
+    'vpv1',
+    'date',
+)
+
+# Reading names of getCurrentReadings and the MQTT keys they come from
+SAMPLE_KEYS = {
+    'pgrid_w' : 'ppv',
+    'load' : 'house_consumption',
+    'grid_voltage' : 'vgrid',
+    'pv_voltage' : 'vpv1',
+    'eday_kwh' : 'pv_daily',
+    'energy_used' : 'house_consumption_daily',
+}
+
 class MQTT:
 
-    def __init__(self, telegram_token, telegram_chatid, mqtt_host, mqtt_port, mqtt_user, mqtt_password, mqtt_topic):
+    def __init__(self, telegram_token, telegram_chatid, mqtt_host, mqtt_port, mqtt_user, mqtt_password, mqtt_topic, timeout=30, max_age=None, clock=time.time):
         self.telegram_token = telegram_token
         self.telegram_chatid = telegram_chatid
         self.mqtt_host = mqtt_host
@@ -23,101 +50,114 @@ class MQTT:
         self.mqtt_user = mqtt_user
         self.mqtt_password = mqtt_password
         self.mqtt_topic = mqtt_topic
-        self.client = mqtt.Client()
-        mqtt.Client.connected_flag = False
-        mqtt.Client.bad_connection_flag = False
+        self.timeout = timeout
+        self.max_age = max_age
+        self.clock = clock
+        self.client = None
+        self.connected = threading.Event()
+        self.lock = threading.Lock()
+        self.updated = threading.Condition(self.lock)
         self.raw_data = {}
+        self.received = {}
+        self.samples = collections.deque(maxlen=1000)
 
-    # notification
-    def telegram_notify(self, telegram_token, telegram_chatid, message):
-        token = self.telegram_token
-        chat_id = self.telegram_chatid
-        bot = telegram.Bot(token=token)
-        bot.sendMessage(chat_id=chat_id, text=message)
+    def start(self):
+        ''' Connect once and keep receiving readings in the background, reconnecting when needed. '''
+        if self.client is not None:
+            return
+        client = mqtt.Client()
+        client.on_connect = self.on_connect
+        client.on_disconnect = self.on_disconnect
+        client.on_message = self.on_message
+        client.username_pw_set(self.mqtt_user, password=self.mqtt_password)
+        client.reconnect_delay_set(min_delay=1, max_delay=60)
+        client.connect_async(self.mqtt_host, port=int(self.mqtt_port or 1883))
+        client.loop_start()
+        self.client = client
 
-    def mqtt_server_connection(self, telegram_token, telegram_chatid, mqtt_host, mqtt_port, mqtt_user, mqtt_password, mqtt_topic):
-        currentTime = datetime.now()
-        try:
-            tries = 5
-            client = self.client
-            client.on_connect = self.on_connect
-            client.on_message = self.on_message
-            client.username_pw_set(self.mqtt_user, password=self.mqtt_password)
-            client.connect(self.mqtt_host, port=int(mqtt_port))
-            client.loop_start()
-            if not client.connected_flag and not client.bad_connection_flag:
-                time.sleep(12)
-            if client.bad_connection_flag:
-                client.loop_stop()
-                sys.exit(1)
-            for i in range(tries):
-                raw_data = self.raw_data
-                #if not 'ppv' or not 'vgrid' or not 'vpv1' or not 'house_consumption' or not 'pv_daily' or not 'house_consumption_daily' or not 'temperature' in raw_data:      
-                if not 'pv_daily' in raw_data:
-                    logging.info("Failed to get 'pv_daily' values from mqtt broker. Retrying: " + str(i))
-                    time.sleep(5)
-                elif not 'house_consumption_daily' in raw_data:
-                    logging.info("Failed to get 'house_consumption_daily' values from mqtt broker. Retrying: " + str(i))
-                    time.sleep(5)
-                elif not 'temperature' in raw_data:
-                    logging.info("Failed to get 'temperature' values from mqtt broker. Retrying: " + str(i))
-                    time.sleep(5)
-                elif not 'vpv1' in raw_data:
-                    logging.info("Failed to get 'vpv1' values from mqtt broker. Retrying: " + str(i))
-                    time.sleep(5)
-                elif not 'ppv' in raw_data:
-                    logging.info("Failed to get 'ppv' values from mqtt broker. Retrying: " + str(i))
-                    time.sleep(5)
-                elif not 'vgrid' in raw_data:
-                    logging.info("Failed to get 'vgrid' values from mqtt broker. Retrying: " + str(i))
-                    time.sleep(5)
-                elif not 'work_mode_label' in raw_data:
-                    logging.info("Failed to get 'work_mode_label' values from mqtt broker. Retrying: " + str(i))
-                    time.sleep(5)
-                elif not 'house_consumption' in raw_data:
-                    logging.info("Failed to get 'house_consumption' values from mqtt broker. Retrying: " + str(i))
-                    time.sleep(5)
-                else:
-                    break
-            client.loop_stop()
-            return self.raw_data
-        except Exception as exp:
-            errorMsg = ("Unable to connect mqtt broker - " + str(self.mqtt_host) + " - Reason: " + str(exp))
-            logging.error(str(currentTime) + " - " + str(errorMsg))
-            telegramMsg = ("[gw2pvo-alt] " + str(errorMsg))
-            try:
-                self.telegram_notify(self.telegram_token, self.telegram_chatid, telegramMsg)
-            except Exception as exp:
-                logging.error(str(currentTime) + " - Failed to send telegram notification - " + str(exp))
-            
-            sys.exit(1)
+    def stop(self):
+        if self.client is None:
+            return
+        self.client.disconnect()
+        self.client.loop_stop()
+        self.client = None
+        self.connected.clear()
+
+    def stale_keys(self, since):
+        ''' The required readings not received since timestamp since. '''
+        return [ key for key in REQUIRED_KEYS if self.received.get(key, since - 1) < since ]
+
+    def wait_for_readings(self, timeout):
+        ''' Block until every required reading has been received, and when
+        max_age is set, received less than max_age seconds ago. A bridge that
+        went silent would otherwise have its last readings uploaded forever. '''
+        deadline = time.monotonic() + timeout
+        with self.updated:
+            since = self.clock() - self.max_age if self.max_age else float('-inf')
+            stale = self.stale_keys(since)
+            while stale and self.updated.wait(max(deadline - time.monotonic(), 0)):
+                stale = self.stale_keys(since)
+            if stale:
+                if not self.connected.is_set():
+                    raise Exception("Unable to connect mqtt broker - " + str(self.mqtt_host))
+                if stale[0] in self.received:
+                    raise Exception("No new '{}' value from mqtt broker in the last {:.0f} seconds".format(stale[0], self.clock() - self.received[stale[0]]))
+                raise Exception("Failed to get '{}' values from mqtt broker within {} seconds".format(stale[0], timeout))
+            return dict(self.raw_data)
 
     def on_connect(self, client, userdata, flags, rc):
         currentTime = datetime.now()
         if rc==0:
-            client.connected_flag=True
+            self.connected.set()
             successMsg = ("Connected to mqtt broker - " + str(self.mqtt_host) + " - Result: " + str(rc))
             logging.info(str(currentTime) + " - " + str(successMsg))
             client.subscribe(str(self.mqtt_topic)+"/#")
         else:
-            client.bad_connection_flag=True
             errorMsg = ("Unable to connect mqtt broker - " + str(self.mqtt_host) + " - Result: " + str(rc))
             logging.error(str(currentTime) + " - " + str(errorMsg))
             telegramMsg = ("[gw2pvo-alt] " + str(errorMsg))
-            try:
-                self.telegram_notify(self.telegram_token, self.telegram_chatid, telegramMsg)
-            except Exception as exp:
-                logging.error(str(currentTime) + " - Failed to send telegram notification - " + str(exp))
+            notify.telegram(self.telegram_token, self.telegram_chatid, telegramMsg)
+
+    def on_disconnect(self, client, userdata, rc):
+        self.connected.clear()
+        if rc != 0:
+            logging.warning("Lost connection to mqtt broker - " + str(self.mqtt_host) + " - Result: " + str(rc))
 
     def on_message(self, client, userdata, msg):
         payload = str(msg.payload.decode('utf-8'))
-        path = msg.topic.split("/")
-        if(path[0] == self.mqtt_topic):
+        trace.record('mqtt', self.mqtt_topic, { 'topic' : msg.topic, 'payload' : payload })
+        self.receive(msg.topic, payload)
+
+    def receive(self, topic, payload):
+        path = topic.split("/")
+        if path[0] == self.mqtt_topic and len(path) > 2:
             reading = path[2]
-            self.raw_data[reading] = payload
-    
-    def getCurrentReadings(self):
-        data = self.mqtt_server_connection(self.telegram_token, self.telegram_chatid, self.mqtt_host, self.mqtt_port, self.mqtt_user, self.mqtt_password, self.mqtt_topic)
+            with self.updated:
+                self.raw_data[reading] = payload
+                self.received[reading] = self.clock()
+                if reading == 'ppv':
+                    self.add_sample()
+                self.updated.notify_all()
+
+    def add_sample(self):
+        # Every power update is a sample, together with the latest other readings
+        try:
+            sample = { name : float(self.raw_data[key]) for name, key in SAMPLE_KEYS.items() }
+        except (KeyError, ValueError):
+            return
+        self.samples.append((self.clock(), sample))
+
+    def pop_samples(self):
+        ''' The samples received since the previous call, as (timestamp, sample) tuples. '''
+        with self.lock:
+            samples = list(self.samples)
+            self.samples.clear()
+        return samples
+
+    def getCurrentReadings(self, timeout=None):
+        self.start()
+        with metrics.MQTT_WAIT_SECONDS.time():
+            data = self.wait_for_readings(self.timeout if timeout is None else min(self.timeout, timeout))
         result = {
             'status' : '',
             'eday_kwh' : 0,
@@ -139,6 +179,7 @@ class MQTT:
         result['grid_voltage'] = float(data['vgrid'])
         result['pv_voltage'] = float(data['vpv1'])
         result['date'] = datetime.strptime(str(data['date']), '%Y-%m-%dT%H:%M:%S').strftime('%Y-%m-%d %H:%M')
+        result['samples'] = self.pop_samples()
         
         message = "Status: {status}, Current PV power: {pgrid_w}W, Total PV power generated today: {eday_kwh}kWh, Current consumption: {load}kW, Total consumption today: {energy_used}kWh, Current grid voltage: {grid_voltage}V, Current PV voltage: {pv_voltage}V, Temperature is {temperature} degrees".format(**result)
 
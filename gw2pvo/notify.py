@@ -0,0 +1,161 @@
+import logging
+import queue
+import threading
+import time
+
+from gw2pvo import cache
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+# Telegram allows a bot about 20 messages per minute in a chat
+SEND_INTERVAL = 3
+
+# Messages waiting to be sent, beyond that new ones are dropped
+MAX_QUEUED = 20
+
+class Notifier:
+    ''' Send Telegram messages from a background thread.
+
+    notify() only queues the message, so a slow or unreachable Telegram
+    never delays an upload. A message identical to one sent less than
+    window seconds ago is not sent again, but counted and mentioned the
+    next time it is sent. With a filename this is remembered between cron
+    runs. Messages are sent at most one per SEND_INTERVAL seconds. '''
+
+    def __init__(self, token, chat_id, window=3600, filename=None):
+        self.token = token
+        self.chat_id = chat_id
+        self.window = window
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.queue = queue.Queue(MAX_QUEUED)
+        self.thread = None
+        self.next_send = 0
+        self.sent = {}
+        if filename:
+            data = cache.read_json(filename, {})
+            self.sent = data if isinstance(data, dict) else {}
+
+    def notify(self, message):
+        ''' Queue message, unless it was sent recently. '''
+        now = time.time()
+        with self.lock:
+            entry = self.sent.get(message)
+            if entry and now - entry['time'] < self.window:
+                entry['repeated'] += 1
+                self.save()
+                return False
+            if entry and entry['repeated']:
+                text = "{} (repeated {} times since {})".format(message, entry['repeated'], time.strftime('%H:%M', time.localtime(entry['time'])))
+            else:
+                text = message
+
+            try:
+                self.queue.put_nowait(text)
+            except queue.Full:
+                logging.warning("Dropped telegram notification, too many are waiting - " + message)
+                return False
+            # Only a queued message counts as sent, a dropped one goes out the next time
+            self.sent = { key : value for key, value in self.sent.items() if now - value['time'] < self.window }
+            self.sent[message] = { 'time' : now, 'repeated' : 0 }
+            self.save()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True, name="telegram")
+                self.thread.start()
+        return True
+
+    def save(self):
+        if not self.filename:
+            return
+        try:
+            cache.write_json(self.filename, self.sent)
+        except OSError as exp:
+            logging.warning("Failed to save telegram notifications to {}: {}".format(self.filename, exp))
+
+    def next_message(self):
+        with self.lock:
+            try:
+                return self.queue.get_nowait()
+            except queue.Empty:
+                self.thread = None
+                return None
+
+    def run(self):
+        ''' Send the queued messages, until there are none left. '''
+        try:
+            self.send_all()
+        except Exception as exp:
+            logging.error("Failed to send telegram notifications - " + str(exp))
+            while self.next_message() is not None:
+                pass
+
+    def close(self, timeout):
+        ''' Wait at most timeout seconds for the queued messages to be sent. '''
+        with self.lock:
+            thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                logging.warning("Gave up sending {} telegram notifications".format(self.queue.qsize() + 1))
+
+    def send_all(self):
+        import asyncio
+        import telegram
+
+        bot = telegram.Bot(token=self.token)
+        # Recent versions of python-telegram-bot are asynchronous
+        loop = asyncio.new_event_loop()
+        try:
+            message = self.next_message()
+            while message is not None:
+                time.sleep(max(self.next_send - time.monotonic(), 0))
+                try:
+                    result = bot.sendMessage(chat_id=self.chat_id, text=message)
+                    if asyncio.iscoroutine(result):
+                        loop.run_until_complete(result)
+                except Exception as exp:
+                    logging.error("Failed to send telegram notification - " + str(exp))
+                self.next_send = time.monotonic() + SEND_INTERVAL
+                message = self.next_message()
+        finally:
+            loop.close()
+
+_lock = threading.Lock()
+_notifiers = {}
+_window = 3600
+_persistent = False
+
+def configure(window=3600, persistent=False):
+    ''' Set the window of the notifiers created from now on, and whether
+    they remember the sent messages in the cache directory. '''
+    global _window, _persistent
+    with _lock:
+        _window = window
+        _persistent = persistent
+
+def get_notifier(token, chat_id):
+    ''' The notifier of a Telegram chat, shared by all stations. '''
+    with _lock:
+        key = (token, str(chat_id))
+        if key not in _notifiers:
+            filename = cache.cache_file('telegram-{}.json'.format(chat_id)) if _persistent else None
+            _notifiers[key] = Notifier(token, chat_id, _window, filename)
+        return _notifiers[key]
+
+def telegram(token, chat_id, message):
+    ''' Send message in the background, when a bot token and chat are configured. '''
+    if not token or not chat_id:
+        return False
+    return get_notifier(token, chat_id).notify(message)
+
+def close_all(timeout=10):
+    ''' Send the queued messages before exiting. Telegram can not be reached
+    anymore once the interpreter shuts down. '''
+    deadline = time.monotonic() + timeout
+    with _lock:
+        notifiers = list(_notifiers.values())
+    for notifier in notifiers:
+        notifier.close(max(deadline - time.monotonic(), 0))
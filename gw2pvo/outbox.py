@@ -0,0 +1,74 @@
+import os
+import logging
+import sqlite3
+import threading
+import time
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+class Outbox:
+    ''' Durable queue of status readings that still have to reach PVOutput.
+
+    Readings are stored as addbatchstatus.jsp lines, together with the time
+    they were taken, and are only removed once PVOutput accepted them. The
+    queue is bounded both in rows and in age, as PVOutput refuses readings
+    older than 14 days (90 days in donation mode). '''
+
+    def __init__(self, filename, max_rows=10000, max_age_days=14, clock=time.time):
+        self.filename = filename
+        self.clock = clock
+        self.max_rows = max_rows
+        self.max_age = max_age_days * 86400
+        self.lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(filename, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                system_id TEXT NOT NULL,
+                timestamp INTEGER NOT NULL,
+                line TEXT NOT NULL
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS outbox_system ON outbox (system_id, timestamp)")
+
+    def put(self, system_id, timestamp, line):
+        with self.lock:
+            self.db.execute("INSERT INTO outbox (system_id, timestamp, line) VALUES (?, ?, ?)",
+                (str(system_id), int(timestamp), line))
+            self.prune(system_id)
+
+    def prune(self, system_id):
+        expired = self.db.execute("DELETE FROM outbox WHERE system_id = ? AND timestamp < ?",
+            (str(system_id), int(self.clock() - self.max_age))).rowcount
+        overflow = self.db.execute("""
+            DELETE FROM outbox WHERE system_id = ? AND id NOT IN (
+                SELECT id FROM outbox WHERE system_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?
+            )""", (str(system_id), str(system_id), self.max_rows)).rowcount
+        if expired or overflow:
+            logging.warning("Dropped {} readings from the PVOutput outbox".format(expired + overflow))
+
+    def peek(self, system_id, limit, newest=False):
+        ''' The oldest (or newest) queued readings as (id, line) tuples. '''
+        order = "DESC" if newest else "ASC"
+        with self.lock:
+            return self.db.execute(
+                "SELECT id, line FROM outbox WHERE system_id = ? ORDER BY timestamp {0}, id {0} LIMIT ?".format(order),
+                (str(system_id), limit)).fetchall()
+
+    def remove(self, ids):
+        with self.lock:
+            self.db.execute("DELETE FROM outbox WHERE id IN ({})".format(",".join("?" * len(ids))), list(ids))
+
+    def count(self, system_id):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM outbox WHERE system_id = ?", (str(system_id),)).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -5,14 +5,22 @@ import time
 import requests
 import json
 
+from gw2pvo import metrics
+from gw2pvo import station
+from gw2pvo.transport import get_transport
+
 __author__ = "Michaël Hompus"
 __copyright__ = "Copyright 2018, Michaël Hompus"
 __license__ = "MIT"
 __email__ = "michael@hompus.nl"
 
+BASE_URL = "https://api.openweathermap.org/data/2.5/"
+
 class OpenWeatherApi:
-    def __init__(self, api_key):
+    def __init__(self, api_key, transport=None, base_url=None):
         self.api_key = api_key
+        self.transport = transport or get_transport()
+        self.base_url = base_url or BASE_URL
 
     def get_temperature(self, latitude, longitude):
         if latitude is None or longitude is None:
@@ -24,7 +32,7 @@ class OpenWeatherApi:
             'longitude' : longitude
         }
 
-        data = self.call("https://api.openweathermap.org/data/2.5/onecall?lat={latitude}&lon={longitude}&units=metric&exclude=minutely,hourly,daily,alerts&appid={apiKey}".format(**payload), payload)
+        data = self.call(self.base_url + "onecall?lat={latitude}&lon={longitude}&units=metric&exclude=minutely,hourly,daily,alerts&appid={apiKey}".format(**payload), payload)
 
         return data['current']['temperature']
 
@@ -57,7 +65,7 @@ class OpenWeatherApi:
                     'longitude' : longitude,
                     'date' : part_date
                 }
-                data = self.call("https://api.openweathermap.org/data/2.5/onecall/timemachine?lat={latitude}&lon={longitude}&units=metric&dt={date}&appid={apiKey}".format(**payload), payload)
+                data = self.call(self.base_url + "onecall/timemachine?lat={latitude}&lon={longitude}&units=metric&dt={date}&appid={apiKey}".format(**payload), payload)
                 data = data['hourly']
                 for sample in (data):
                     time = sample['time']
@@ -73,7 +81,8 @@ class OpenWeatherApi:
     def call(self, url, payload):
         for i in range(1, 4):
             try:
-                r = requests.get(url, timeout=10)
+                with metrics.WEATHER_REQUEST_SECONDS.time(service='openweather'):
+                    r = self.transport.get(url)
                 r.raise_for_status()
                 result = r.json()
                 result= json.dumps(result)
@@ -83,6 +92,7 @@ class OpenWeatherApi:
                 return result
             except requests.exceptions.RequestException as arg:
                 logging.warning(arg)
+                metrics.RETRIES.inc(service='openweather', station=station.current())
                 time.sleep(i ** 3)
         else:
             logging.error("Failed to call Open Weather API")
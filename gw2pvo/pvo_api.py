@@ -1,34 +1,44 @@
-import sys, os
+import os
 import logging
 import time
+import itertools
 import requests
 import csv
-import telegram
 
 from datetime import datetime
 
+from gw2pvo import cache
+from gw2pvo import metrics
+from gw2pvo import station
+from gw2pvo import notify
+from gw2pvo import ratelimit
+from gw2pvo.temperature import TemperatureSeries
+from gw2pvo.transport import get_transport
+
 __author__ = "Mark Ruys"
 __copyright__ = "Copyright 2017, Mark Ruys"
 __license__ = "MIT"
 __email__ = "mark@paracas.nl"
 
+BASE_URL = "https://pvoutput.org/service/r2/"
+
 class PVOutputApi:
 
-    def __init__(self, telegram_token, telegram_chatid, system_id, api_key):
+    def __init__(self, telegram_token, telegram_chatid, system_id, api_key, transport=None, outbox=None, batch_size=30, base_url=None, deadline=None):
         self.telegram_token = telegram_token
         self.telegram_chatid = telegram_chatid
         self.m_system_id = system_id
         self.m_api_key = api_key
+        self.transport = transport or get_transport()
+        self.limiter = ratelimit.get_limiter(system_id)
+        self.outbox = outbox
+        self.batch_size = batch_size
+        self.base_url = base_url or BASE_URL
+        # No more retries after this time.monotonic()
+        self.deadline = deadline
 
-    # Notification
-    def telegram_notify(self, telegram_token, telegram_chatid, message):
-        token = self.telegram_token
-        chat_id = self.telegram_chatid
-        bot = telegram.Bot(token=token)
-        bot.sendMessage(chat_id=chat_id, text=message)
-
-    def add_status(self, pgrid_w, eday_kwh, temperature, voltage, energy_used, load):
-        t = time.localtime()
+    def add_status(self, pgrid_w, eday_kwh, temperature, voltage, energy_used, load, timestamp=None):
+        t = time.localtime(timestamp)
         payload = {
             'd' : "{:04}{:02}{:02}".format(t.tm_year, t.tm_mon, t.tm_mday),
             't' : "{:02}:{:02}".format(t.tm_hour, t.tm_min),
@@ -44,11 +54,43 @@ class PVOutputApi:
         if voltage is not None:
             payload['v6'] = voltage
 
-        self.call("https://pvoutput.org/service/r2/addstatus.jsp", payload)
-        #print (payload)
+        if self.outbox is None:
+            self.call(self.base_url + "addstatus.jsp", payload, ratelimit.LIVE, block=False)
+            return
+
+        # Queue the reading first, so it survives failed uploads and restarts
+        line = ",".join(str(payload.get(field, '')) for field in ['d', 't', 'v1', 'v2', 'v3', 'v4', 'v5', 'v6'])
+        self.outbox.put(self.m_system_id, time.mktime(t), line)
+        self.drain_outbox()
+
+    def drain_outbox(self):
+        ''' Upload queued readings in as few batches as possible, the most recent batch first. '''
+        priority = ratelimit.LIVE
+        while True:
+            rows = self.outbox.peek(self.m_system_id, self.batch_size, newest=(priority == ratelimit.LIVE))
+            if not rows:
+                return
+            payload = {
+                'data' : ";".join(line for id, line in rows)
+            }
+            pending = -(-self.outbox.count(self.m_system_id) // self.batch_size)
+            r = self.post(self.base_url + "addbatchstatus.jsp", payload, priority, block=False, pending=pending)
+            if r is None:
+                logging.info("{} readings left in the PVOutput outbox".format(self.outbox.count(self.m_system_id)))
+                return
+            # Retrying a reading PVOutput refused would only be refused again
+            for line in rejected_lines([ line for id, line in rows ], r.text):
+                logging.warning("PVOutput did not add reading " + line)
+                metrics.SKIPPED_UPLOADS.inc(reason='rejected', station=station.current())
+            self.outbox.remove([ id for id, line in rows ])
+            priority = ratelimit.BATCH
 
     def add_day(self, data, temperatures):
-        for chunk in [ data[i:i + 30] for i in range(0, len(data), 30) ]:
+        ''' Upload the readings of a day, return whether all were uploaded. '''
+        if temperatures is not None and not isinstance(temperatures, TemperatureSeries):
+            temperatures = TemperatureSeries(temperatures)
+        chunks = [ data[i:i + self.batch_size] for i in range(0, len(data), self.batch_size) ]
+        for n, chunk in enumerate(chunks):
             readings = []
             for reading in chunk:
                 dt = reading['dt']
@@ -61,50 +103,79 @@ class PVOutputApi:
                     str(reading['load'])
                 ]
                 if temperatures is not None:
-                    try:
-                        fields.append('')
-                        fields.append('')
-                        temperature = list(filter(lambda x: dt.timestamp() >= x['time'], temperatures))[-1]
-                        fields.append(str(temperature['temperature']))
-                    except:
-                        print ()
+                    temperature = temperatures.at(dt.timestamp())
+                    if temperature is not None:
+                        fields.append(str(temperature))
                 readings.append(",".join(fields))
 
             payload = {
                 'data' : ";".join(readings)
             }
 
-            self.call("https://pvoutput.org/service/r2/addbatchstatus.jsp", payload)
-            #print (payload)
+            if not self.call(self.base_url + "addbatchstatus.jsp", payload, ratelimit.BATCH, pending=len(chunks) - n):
+                return False
+        return True
 
-    def add_day_csv(self, filename):
-        with open(filename, mode='r', encoding='utf-8-sig') as csvfile:
-            reader = csv.DictReader(csvfile,delimiter=",")
-            data = (list(reader))
-        for chunk in [ data[i:i + 30] for i in range(0, len(data), 30) ]:
-            readings = []
-            for reading in chunk:
-                dt = reading['date']
-                fields = [
-                    datetime.strptime(str(dt), '%Y-%m-%d %H:%M').strftime('%Y%m%d'),
-                    datetime.strptime(str(dt), '%Y-%m-%d %H:%M').strftime('%H:%M'),
-                    str(round(float(reading['eday_kwh']) * 1000)),
-                    str(reading['pgrid_w']),
-                    str(round(float(reading['energy_used']) * 1000)),
-                    str(reading['load']),
-                    str(reading['temp']),
-                    str(reading['voltage'])
-                ]
-                readings.append(", ".join(fields))
-            
-            payload = { 
-                'data' : ";".join(readings) 
+    def add_day_csv(self, filename, temperatures=None, resume_file=None):
+        ''' Upload the readings of a CSV file written by --csv, return whether all were uploaded.
+
+        The file is streamed in batches, so its size does not matter. After
+        each batch the number of uploaded rows is recorded in resume_file,
+        so an interrupted upload continues where it stopped. '''
+        if temperatures is not None and not isinstance(temperatures, TemperatureSeries):
+            temperatures = TemperatureSeries(temperatures)
+        resume_file = resume_file or cache.cache_file('upload-csv.json')
+        key = "{}:{}".format(self.m_system_id, os.path.abspath(filename))
+        offsets = cache.read_json(resume_file, {})
+        size = os.path.getsize(filename)
+
+        # Only resume in the same (or a grown) file
+        offset = offsets.get(key)
+        done = offset['rows'] if offset and offset['size'] <= size else 0
+        if done:
+            logging.info("Resuming upload of {} after {} readings".format(filename, done))
+
+        def save_offset(uploaded):
+            offsets[key] = { 'rows' : done + uploaded, 'size' : size }
+            cache.write_json(resume_file, offsets)
+
+        with open(filename, mode='r', encoding='utf-8-sig', newline='') as csvfile:
+            rows = itertools.islice(csv.DictReader(csvfile, delimiter=","), done, None)
+            if not self.add_csv_rows(rows, temperatures, save_offset):
+                logging.error("Stopped uploading {}, run again to resume".format(filename))
+                return False
+
+        if offsets.pop(key, None) is not None:
+            cache.write_json(resume_file, offsets)
+        logging.info("Uploaded {}".format(filename))
+        return True
+
+    def add_csv_rows(self, rows, temperatures=None, progress=None):
+        ''' Upload rows in the --csv format, return whether all were uploaded.
+
+        progress is called with the number of rows uploaded so far after each batch. '''
+        uploaded = 0
+        for batch in batches(csv_readings(rows, temperatures), self.batch_size):
+            payload = {
+                'data' : ";".join(batch)
             }
+            if not self.call(self.base_url + "addbatchstatus.jsp", payload, ratelimit.BATCH):
+                logging.error("Uploaded {} readings before the upload failed".format(uploaded))
+                return False
+            uploaded += len(batch)
+            if progress:
+                progress(uploaded)
+        logging.info("Uploaded {} readings".format(uploaded))
+        return True
+
+    def call(self, url, payload, priority=ratelimit.BATCH, block=True, pending=1):
+        ''' Post to PVOutput, return whether the request succeeded. '''
+        return self.post(url, payload, priority, block, pending) is not None
 
-            self.call("https://pvoutput.org/service/r2/addbatchstatus.jsp", payload)
-            #print(payload)
+    def post(self, url, payload, priority=ratelimit.BATCH, block=True, pending=1):
+        ''' Post to PVOutput, return the response, or None when the request failed.
 
-    def call(self, url, payload):
+        pending is the number of batch requests still to be sent, including this one. '''
         logging.debug(payload)
         headers = {
             'X-Pvoutput-Apikey' : self.m_api_key,
@@ -113,53 +184,109 @@ class PVOutputApi:
         }
 
         for i in range(1, 4):
+            # Live status must not wait for the budget, batches wait for the reset
+            if not self.limiter.acquire(priority, None if block else 0, pending):
+                if self.limiter.available(priority):
+                    logging.debug("Holding back the upload to pace the PVOutput batch uploads")
+                    return None
+                logging.warning("Skipped upload as the PVOutput rate limit is used up")
+                metrics.SKIPPED_UPLOADS.inc(reason='rate_limit', station=station.current())
+                return None
             try:
-                r = requests.post(url, headers=headers, data=payload, timeout=15)
-                #self.telegram_notify(self.telegram_token, self.telegram_chatid, "test")
+                with metrics.PVOUTPUT_REQUEST_SECONDS.time(service=url.split('/')[-1].split('.')[0]):
+                    r = self.transport.post(url, headers=headers, data=payload)
+                #notify.telegram(self.telegram_token, self.telegram_chatid, "test")
+                self.limiter.update(r.headers)
                 if 'X-Rate-Limit-Reset' in r.headers:
                     reset = round(float(r.headers['X-Rate-Limit-Reset']) - time.time())
                 else:
                     reset = 0
                 if 'X-Rate-Limit-Remaining' in r.headers:
+                    metrics.PVOUTPUT_RATE_LIMIT_REMAINING.set(int(r.headers['X-Rate-Limit-Remaining']), system=self.m_system_id)
                     if int(r.headers['X-Rate-Limit-Remaining']) < 10:
                         warningMsg = ("Only {} requests left, reset after {} seconds".format(
                             r.headers['X-Rate-Limit-Remaining'],
                             reset))
                         logging.warning(warningMsg)
                         telegramMsg = ("[gw2pvo-alt] " +str(warningMsg))
-                        #self.telegram_notify(self.telegram_token, self.telegram_chatid, telegramMsg)
+                        #notify.telegram(self.telegram_token, self.telegram_chatid, telegramMsg)
                 if r.status_code == 401:
-                    warningMsg = ("Unable to connect to pvoutput.org - Reason: " + r.reason)
-                    logging.warning(warningMsg)
-                    sys.exit(1)
+                    # Retrying will not help, stop uploading for this station only
+                    raise Exception("Unable to connect to pvoutput.org - Reason: " + r.reason)
                 if r.status_code == 403:
                     warningMsg = ("Unable to connect to pvoutput.org - Forbidden: " + r.reason)
                     logging.warning(warningMsg)
-                    time.sleep(reset + 1)
+                    self.limiter.exhaust(time.time() + reset + 1 if reset > 0 else None)
+                    metrics.RETRIES.inc(service='pvoutput', station=station.current())
+                    continue
                 if r.status_code == 503:
                     warningMsg = ("Unable to connect to pvoutput.org - Reason: " + r.reason)
                     logging.warning(warningMsg)
-                    #self.telegram_notify(self.telegram_token, self.telegram_chatid, warningMsg)
-                    time.sleep(120)
+                    #notify.telegram(self.telegram_token, self.telegram_chatid, warningMsg)
+                    metrics.RETRIES.inc(service='pvoutput', station=station.current())
+                    if not self.wait_retry(120):
+                        return None
                 else:
                     infoMsg = ("PVOutput.org result: " + r.reason)
                     logging.info(infoMsg)
                     r.raise_for_status()
-                    break
+                    return r
             except requests.exceptions.RequestException as arg:
-                warningMsg = (r.text or str(arg))
+                warningMsg = (arg.response is not None and arg.response.text) or str(arg)
                 logging.warning(warningMsg)
-                try:
-                    self.telegram_notify(self.telegram_token, self.telegram_chatid, warningMsg)
-                except Exception as exp:
-                    logging.error(str(currentTime) + " - Failed to send telegram notification - " + str(exp))
+                metrics.RETRIES.inc(service='pvoutput', station=station.current())
+                notify.telegram(self.telegram_token, self.telegram_chatid, warningMsg)
 
-            time.sleep(i ** 3)
+            if not self.wait_retry(i ** 3):
+                return None
         else:
             errorMsg = ("Failed to call PVOutput API")
             logging.error(errorMsg)
-            try:
-                self.telegram_notify(self.telegram_token, self.telegram_chatid, errorMsg)
-            except Exception as exp:
-                logging.error(str(currentTime) + " - Failed to send telegram notification - " + str(exp))
+            notify.telegram(self.telegram_token, self.telegram_chatid, errorMsg)
+            return None
+
+    def wait_retry(self, seconds):
+        ''' Sleep before retrying, unless that would pass the deadline. '''
+        if self.deadline is not None and time.monotonic() + seconds > self.deadline:
+            logging.warning("Gave up calling PVOutput API for this cycle (deadline passed)")
+            return False
+        time.sleep(seconds)
+        return True
+
+def rejected_lines(lines, response):
+    ''' The addbatchstatus lines PVOutput did not add. It answers with the
+    date, time and 1 (added) or 0 (not added) of each line. '''
+    added = {}
+    for result in response.strip().split(';'):
+        fields = result.split(',')
+        if len(fields) == 3:
+            added[(fields[0], fields[1])] = fields[2].strip() == '1'
+    return [ line for line in lines if not added.get(tuple(line.split(',')[:2]), True) ]
+
+def csv_readings(rows, temperatures=None):
+    ''' Turn CSV rows into addbatchstatus readings, one at a time. '''
+    for row in rows:
+        dt = datetime.strptime(row['date'], '%Y-%m-%d %H:%M')
+        temperature = row['temp']
+        if temperatures is not None and not temperature:
+            temperature = temperatures.at(dt.timestamp())
+            temperature = '' if temperature is None else temperature
+        yield ", ".join([
+            dt.strftime('%Y%m%d'),
+            dt.strftime('%H:%M'),
+            str(round(float(row['eday_kwh']) * 1000)),
+            str(row['pgrid_w']),
+            str(round(float(row['energy_used']) * 1000)),
+            str(row['load']),
+            str(temperature),
+            str(row['voltage']),
+        ])
 
+def batches(items, size):
+    ''' Lists of up to size consecutive items, without reading ahead any further. '''
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
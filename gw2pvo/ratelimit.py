@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+# Request priorities, live status always goes before batch uploads
+LIVE = 0
+BATCH = 1
+
+# Seconds until PVOutput resets the budget, before it told so
+WINDOW = 3600
+
+class RateLimiter:
+    ''' Token bucket tracking the hourly request budget of a PVOutput system.
+
+    The bucket is kept in sync with the X-Rate-Limit-* response headers and
+    refills when PVOutput resets the budget. Batch uploads leave `reserve`
+    requests untouched, so live status updates can always go through. They
+    go out at once while the budget covers the batches still to be sent,
+    otherwise they are paced to spread the budget over the rest of the
+    hour, instead of using it up at once and then stalling until the reset. '''
+
+    def __init__(self, limit=60, reserve=10, clock=time.time):
+        self.limit = limit
+        self.reserve = reserve
+        self.clock = clock
+        self.tokens = limit
+        self.reset = None
+        self.next_batch = 0
+        self.condition = threading.Condition()
+
+    def refill(self, now):
+        if self.reset is not None and now >= self.reset:
+            self.tokens = self.limit
+            self.reset = None
+            self.next_batch = 0
+
+    def spacing(self, now, pending):
+        ''' Seconds until the next batch request, the time left in the window divided by the batch budget left.
+
+        No spacing is needed while the budget covers the pending batches. '''
+        budget = self.tokens - self.reserve
+        if budget <= 0 or pending <= budget:
+            return 0
+        window = self.reset - now if self.reset is not None else WINDOW
+        return max(window, 0) / budget
+
+    def acquire(self, priority=BATCH, timeout=None, pending=1):
+        ''' Take a token, waiting while the budget is too low for this priority.
+
+        pending is the number of batch requests the caller still has to
+        send, including this one. Returns False when no token became available within timeout seconds. '''
+        floor = self.reserve if priority == BATCH else 0
+        deadline = None if timeout is None else time.monotonic() + timeout
+        logged = False
+        with self.condition:
+            while True:
+                now = self.clock()
+                self.refill(now)
+                paced = priority == BATCH and now < self.next_batch
+                if self.tokens > floor and not paced:
+                    self.tokens -= 1
+                    if priority == BATCH:
+                        self.next_batch = now + self.spacing(now, pending - 1)
+                    return True
+                if self.tokens > floor:
+                    wait = self.next_batch - now
+                else:
+                    wait = self.reset - now if self.reset is not None else 60
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        return False
+                if not logged:
+                    if paced:
+                        logging.debug("Pacing PVOutput batch uploads, next one in {:.0f} seconds".format(wait))
+                    else:
+                        logging.info("PVOutput rate limit reached, holding back uploads for {:.0f} seconds".format(wait))
+                    logged = True
+                self.condition.wait(wait)
+
+    def available(self, priority=BATCH):
+        ''' Whether the budget has a token left for this priority, pacing aside. '''
+        with self.condition:
+            self.refill(self.clock())
+            return self.tokens > (self.reserve if priority == BATCH else 0)
+
+    def update(self, headers):
+        ''' Synchronise with the rate limit headers of a PVOutput response. '''
+        with self.condition:
+            if 'X-Rate-Limit-Limit' in headers:
+                self.limit = int(headers['X-Rate-Limit-Limit'])
+            if 'X-Rate-Limit-Remaining' in headers:
+                self.tokens = int(headers['X-Rate-Limit-Remaining'])
+            if 'X-Rate-Limit-Reset' in headers:
+                self.reset = float(headers['X-Rate-Limit-Reset'])
+            self.condition.notify_all()
+
+    def exhaust(self, reset=None):
+        ''' PVOutput refused a request, so nothing is left until the reset. '''
+        with self.condition:
+            self.tokens = 0
+            if reset is not None:
+                self.reset = reset
+            elif self.reset is None:
+                self.reset = self.clock() + WINDOW
+
+_lock = threading.Lock()
+_limiters = {}
+
+def get_limiter(system_id):
+    ''' The limiter for a system, shared by all PVOutputApi instances. '''
+    with _lock:
+        if system_id not in _limiters:
+            _limiters[system_id] = RateLimiter()
+        return _limiters[system_id]
@@ -0,0 +1,125 @@
+import logging
+import time
+
+from gw2pvo import mqtt
+from gw2pvo import trace
+from gw2pvo.standin import StandIn
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+class ReplayMQTT(mqtt.MQTT):
+    ''' MQTT reader fed from a trace instead of a broker. '''
+
+    def start(self):
+        self.connected.set()
+
+    def stop(self):
+        pass
+
+class Replay:
+    ''' Drive the upload cycles through a recorded trace.
+
+    SEMS responses are served by a local stand-in, which also stands in for
+    PVOutput and OpenWeather, and MQTT messages are fed to a ReplayMQTT. A
+    SEMS record is one cycle, MQTT messages run a cycle each interval of
+    trace time. The cycles see the trace time as the current time, so the
+    readings are uploaded, resampled and archived at the time they were
+    recorded. The trace plays speed times faster than it was recorded, or
+    as fast as possible for speed 0. '''
+
+    def __init__(self, filename, speed=0, interval=300):
+        self.filename = filename
+        self.speed = speed
+        self.interval = interval
+        self.current = {}
+        self.now = None
+
+    def clock(self):
+        return self.now
+
+    def prepare(self, state, standin):
+        settings = state.settings
+        settings.sems_url = standin.url + 'api/'
+        settings.pvo_url = standin.url + 'service/r2/'
+        settings.openweather_url = standin.url + 'data/2.5/'
+        settings.darksky_api_key = None
+        settings.telegram_token = None
+        # The trace only has the readings that were taken, night or day
+        settings.skip_night = False
+        # Waiting for the next reading would wait for the real clock
+        settings.adaptive_polling = False
+        # Never reuse the real SEMS login
+        settings.gw_account = 'replay:{}'.format(settings.gw_account)
+        state.clock = self.clock
+        if settings.mqtt_host:
+            state.mqtt_broker = ReplayMQTT(None, None, settings.mqtt_host, settings.mqtt_port, None, None, settings.mqtt_topic, 0,
+                max_age=self.interval, clock=self.clock)
+
+    def wait(self, trace_time, first, start):
+        if self.speed > 0:
+            delay = (trace_time - first) / self.speed - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+    def run(self, stations, run_cycle, key):
+        ''' Replay the trace, run_cycle(state) runs a cycle of a station and key(settings)
+        gives the station a record belongs to. Returns the statistics. '''
+        standin = StandIn(
+            responses={ 'GetMonitorDetailByPowerstationId' : lambda params: self.current[params['powerStationId']] },
+            rate_limit=1000000,
+        ).start()
+        by_key = { key(state.settings) : state for state in stations }
+        for state in stations:
+            self.prepare(state, standin)
+
+        cycles = 0
+        records = 0
+        first = None
+        next_cycle = None
+        start = time.monotonic()
+        try:
+            for rec in trace.read(self.filename):
+                state = by_key.get(rec['station']) or (stations[0] if len(stations) == 1 else None)
+                if state is None:
+                    continue
+                if first is None:
+                    first = rec['time']
+                    next_cycle = first + self.interval
+                records += 1
+
+                # Cycles of MQTT stations are due each interval of trace time
+                while rec['time'] >= next_cycle:
+                    self.wait(next_cycle, first, start)
+                    self.now = next_cycle
+                    for mqtt_state in stations:
+                        if mqtt_state.settings.mqtt_host:
+                            run_cycle(mqtt_state)
+                            cycles += 1
+                    next_cycle += self.interval
+
+                self.wait(rec['time'], first, start)
+                self.now = rec['time']
+                if rec['kind'] == 'sems':
+                    self.current[state.settings.gw_station_id] = rec['data']
+                    run_cycle(state)
+                    cycles += 1
+                elif rec['kind'] == 'mqtt' and state.mqtt_broker is not None:
+                    state.mqtt_broker.receive(rec['data']['topic'], rec['data']['payload'])
+        finally:
+            standin.stop()
+
+        elapsed = time.monotonic() - start
+        stats = {
+            'records' : records,
+            'cycles' : cycles,
+            'elapsed' : elapsed,
+            'addstatus' : standin.count('/service/r2/addstatus.jsp'),
+            'addbatchstatus' : standin.count('/service/r2/addbatchstatus.jsp'),
+        }
+        logging.info("Replayed {records} records in {cycles} cycles in {elapsed:.1f} s, {addstatus} addstatus and {addbatchstatus} addbatchstatus requests".format(**stats))
+        if elapsed > 0:
+            logging.info("{:.1f} cycles/s".format(cycles / elapsed))
+        return stats
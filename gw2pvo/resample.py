@@ -0,0 +1,109 @@
+import math
+
+import numpy as np
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+def resample(timestamps, interval, mean=None, last=None, extremes=None):
+    ''' Aggregate samples onto the interval grid.
+
+    Each bucket is labelled with its end time, like PVOutput labels a status
+    with the end of the interval it covers. mean, last and extremes map
+    names to columns of values. The result maps 'time' to the bucket end
+    times, each name in mean to its average, each name in last to the value
+    of the last sample, and each name in extremes to name_min and name_max. '''
+    ts = np.asarray(timestamps, dtype=float)
+    order = np.argsort(ts, kind='stable')
+    ends = np.ceil(ts[order] / interval) * interval
+    labels, starts, counts = np.unique(ends, return_index=True, return_counts=True)
+
+    result = { 'time' : labels }
+    columns = [ (name, values, 'mean') for name, values in (mean or {}).items() ]
+    columns += [ (name, values, 'last') for name, values in (last or {}).items() ]
+    columns += [ (name, values, 'extremes') for name, values in (extremes or {}).items() ]
+    for name, values, kind in columns:
+        values = np.asarray(values, dtype=float)[order]
+        if len(values) == 0:
+            values = np.zeros(0)
+            if kind == 'extremes':
+                result[name + '_min'] = result[name + '_max'] = values
+            else:
+                result[name] = values
+        elif kind == 'mean':
+            result[name] = np.add.reduceat(values, starts) / counts
+        elif kind == 'last':
+            result[name] = values[starts + counts - 1]
+        else:
+            result[name + '_min'] = np.minimum.reduceat(values, starts)
+            result[name + '_max'] = np.maximum.reduceat(values, starts)
+    return result
+
+class Resampler:
+    ''' Incremental resample() for a live stream of samples.
+
+    Samples up to slack seconds after a grid boundary still count for the
+    bucket ending at that boundary, so a reading taken right when a cycle
+    starts is not postponed to the next interval. Samples for a bucket that
+    was already closed go into the next one. '''
+
+    def __init__(self, interval, mean=(), last=(), extremes=(), slack=0):
+        self.interval = interval
+        self.mean = mean
+        self.last = last
+        self.extremes = extremes
+        self.slack = slack
+        self.end = None
+        self.closed_until = None
+        self.completed = []
+
+    def start(self, end):
+        self.end = end
+        self.count = 0
+        self.sums = dict.fromkeys(self.mean, 0.0)
+        self.values = {}
+        self.minima = {}
+        self.maxima = {}
+
+    def add(self, timestamp, sample):
+        end = math.ceil((timestamp - self.slack) / self.interval) * self.interval
+        if self.closed_until is not None and end <= self.closed_until:
+            end = self.closed_until + self.interval
+        if self.end is not None and end > self.end and self.count > 0:
+            self.completed.append(self.summary())
+            self.closed_until = self.end
+            self.end = None
+        if self.end is None or end > self.end:
+            self.start(end)
+
+        self.count += 1
+        for name in self.mean:
+            self.sums[name] += sample[name]
+        for name in self.last:
+            self.values[name] = sample[name]
+        for name in self.extremes:
+            value = sample[name]
+            self.minima[name] = min(self.minima.get(name, value), value)
+            self.maxima[name] = max(self.maxima.get(name, value), value)
+
+    def summary(self):
+        result = { 'time' : self.end }
+        for name in self.mean:
+            result[name] = self.sums[name] / self.count
+        result.update(self.values)
+        for name in self.extremes:
+            result[name + '_min'] = self.minima[name]
+            result[name + '_max'] = self.maxima[name]
+        return result
+
+    def close(self, until):
+        ''' Return all buckets ending at or before until, in time order. '''
+        if self.end is not None and self.end <= until and self.count > 0:
+            self.completed.append(self.summary())
+            self.closed_until = self.end
+            self.end = None
+        buckets = self.completed
+        self.completed = []
+        return buckets
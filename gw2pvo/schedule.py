@@ -0,0 +1,141 @@
+import logging
+import math
+import time
+
+from datetime import datetime
+
+from gw2pvo import metrics
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+# When each stage of a cycle has to be finished, as part of the interval
+STAGE_DEADLINES = {
+    'fetch' : 0.5,
+    'csv' : 0.55,
+    'weather' : 0.65,
+    'upload' : 0.9,
+}
+
+# A boundary missed by less than this part of the interval is still run
+MAX_LATE = 0.25
+
+# Follow the wall clock when it is set more than this many seconds
+MAX_CLOCK_STEP = 1
+
+class Scheduler:
+    ''' Wake up on the multiples of interval seconds of the wall clock.
+
+    The boundaries are counted on the monotonic clock from a single anchor,
+    so a slow cycle does not shift the ones after it. When a cycle overran
+    the next boundary, the most recent boundary is still run if it was
+    missed by less than MAX_LATE of the interval, otherwise the scheduler
+    waits for the next one. Missed boundaries and the slip of each wake-up
+    are reported. '''
+
+    def __init__(self, interval, clock=time.monotonic, wallclock=time.time, sleep=time.sleep):
+        self.interval = interval
+        self.clock = clock
+        self.wallclock = wallclock
+        self.sleep = sleep
+        self.anchor = self.offset()
+        self.next = self.anchor + interval
+
+    def offset(self):
+        ''' The monotonic time of a wall clock boundary. '''
+        now = self.clock()
+        return now - self.wallclock() % self.interval
+
+    def realign(self):
+        anchor = self.offset()
+        step = (anchor - self.anchor + self.interval / 2) % self.interval - self.interval / 2
+        if abs(step) > MAX_CLOCK_STEP:
+            logging.info("Wall clock moved {:.1f} seconds, realigning the schedule".format(-step))
+            self.anchor += step
+            self.next += step
+
+    def upcoming(self):
+        ''' The wall clock time of the next boundary. '''
+        return self.wallclock() + self.next - self.clock()
+
+    def due(self, start, interval):
+        ''' Whether the boundary at monotonic time start is a multiple of interval seconds of the wall clock. '''
+        boundary = round((self.wallclock() - self.clock() + start) / self.interval) * self.interval
+        return boundary % interval == 0
+
+    def wait(self, resume=None):
+        ''' Sleep until the next boundary to run, but not before the wall
+        clock time resume, return its monotonic time. '''
+        self.realign()
+        late = self.clock() - self.next
+        skipped = 0
+        if late > 0:
+            skipped = int(late // self.interval)
+            self.next += skipped * self.interval
+            if late - skipped * self.interval > MAX_LATE * self.interval:
+                skipped += 1
+                self.next += self.interval
+            else:
+                logging.warning("Running a cycle {:.1f} seconds late".format(self.clock() - self.next))
+        if skipped:
+            logging.warning("Skipped {} cycles, the previous cycle overran by {:.1f} seconds".format(skipped, late))
+            metrics.SKIPPED_CYCLES.inc(skipped)
+
+        if resume is not None and resume > self.upcoming():
+            self.next += math.ceil((resume - self.upcoming()) / self.interval) * self.interval
+            logging.info("Sleeping until {:%Y-%m-%d %H:%M}".format(datetime.fromtimestamp(self.upcoming())))
+
+        delay = self.next - self.clock()
+        if delay > 0:
+            self.sleep(delay)
+
+        start = self.next
+        slip = self.clock() - start
+        metrics.SCHEDULE_SLIP_SECONDS.observe(max(slip, 0))
+        logging.debug("Cycle started {:.3f} seconds after its boundary".format(slip))
+        self.next += self.interval
+        return start
+
+class Cycle:
+    ''' The deadlines of the stages of a cycle that started at start, on the
+    monotonic clock, and may take interval seconds. '''
+
+    def __init__(self, start, interval, clock=time.monotonic):
+        self.start = start
+        self.interval = interval
+        self.clock = clock
+
+    def deadline(self, stage):
+        return self.start + STAGE_DEADLINES[stage] * self.interval
+
+    def remaining(self, stage):
+        ''' Seconds left to finish stage. '''
+        return max(self.deadline(stage) - self.clock(), 0)
+
+    def expired(self, stage):
+        return self.clock() >= self.deadline(stage)
+
+    def stage(self, stage):
+        ''' Context manager timing a stage and reporting when it overran its deadline. '''
+        return Stage(self, stage)
+
+class Stage:
+
+    def __init__(self, cycle, name):
+        self.cycle = cycle
+        self.name = name
+
+    def __enter__(self):
+        self.started = self.cycle.clock()
+        return self
+
+    def __exit__(self, *exc):
+        now = self.cycle.clock()
+        metrics.STAGE_SECONDS.observe(now - self.started, stage=self.name)
+        overrun = now - self.cycle.deadline(self.name)
+        if overrun > 0:
+            logging.warning("The {} stage finished {:.1f} seconds after its deadline".format(self.name, overrun))
+            metrics.STAGE_OVERRUNS.inc(stage=self.name)
+        return False
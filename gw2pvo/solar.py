@@ -0,0 +1,64 @@
+import logging
+
+from datetime import datetime, timedelta, timezone
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+class SolarSchedule:
+    ''' Dawn and dusk at a location, computed once per day.
+
+    Cycles run from dawn until dusk, and one more cycle in the interval
+    after dusk uploads the totals of the day. '''
+
+    def __init__(self, observer, tzinfo):
+        self.observer = observer
+        self.tzinfo = tzinfo
+        self.days = {}
+
+    @classmethod
+    def at(cls, latitude, longitude):
+        ''' The schedule at coordinates, using local solar time as the time zone. '''
+        from astral import Observer
+        offset = timedelta(minutes=round(float(longitude) * 4))
+        return cls(Observer(float(latitude), float(longitude)), timezone(offset))
+
+    def times(self, day):
+        ''' Dawn and dusk of day as timestamps, None when the sun does not rise or set. '''
+        if day not in self.days:
+            from astral.sun import sun
+            try:
+                events = sun(self.observer, day, tzinfo=self.tzinfo)
+                times = (events['dawn'].timestamp(), events['dusk'].timestamp())
+                logging.debug("Dawn at {:%H:%M}, dusk at {:%H:%M}".format(events['dawn'].astimezone(), events['dusk'].astimezone()))
+            except ValueError:
+                times = None
+            # Only today and tomorrow are asked for
+            if len(self.days) > 2:
+                self.days.clear()
+            self.days[day] = times
+        return self.days[day]
+
+    def day(self, moment):
+        return datetime.fromtimestamp(moment, self.tzinfo).date()
+
+    def active(self, moment, interval):
+        ''' Whether a cycle should run at timestamp moment. '''
+        times = self.times(self.day(moment))
+        if times is None:
+            return True
+        dawn, dusk = times
+        return dawn <= moment < dusk + interval
+
+    def next_active(self, moment, interval):
+        ''' The first timestamp from moment on a cycle should run. '''
+        if self.active(moment, interval):
+            return moment
+        day = self.day(moment)
+        dawn, dusk = self.times(day)
+        if moment < dawn:
+            return dawn
+        tomorrow = self.times(day + timedelta(days=1))
+        return tomorrow[0] if tomorrow else moment
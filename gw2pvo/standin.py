@@ -0,0 +1,233 @@
+import json
+import logging
+import math
+import threading
+import time
+
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit, parse_qs
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+TOKEN = 'standin'
+
+def solar_power(moment, peak=4000):
+    ''' A clear sky power curve between 6:00 and 20:00. '''
+    hours = moment.hour + moment.minute / 60 + moment.second / 3600
+    if hours < 6 or hours > 20:
+        return 0
+    return round(peak * math.sin(math.pi * (hours - 6) / 14))
+
+def solar_energy(moment, peak=4000):
+    ''' The energy in kWh of solar_power() from midnight up to moment. '''
+    hours = min(max(moment.hour + moment.minute / 60 + moment.second / 3600, 6), 20)
+    return round(peak / 1000 * 14 / math.pi * (1 - math.cos(math.pi * (hours - 6) / 14)), 1)
+
+def sems_detail(moment, latitude=52.37, longitude=4.89):
+    ''' A GetMonitorDetailByPowerstationId response at moment. '''
+    power = solar_power(moment)
+    return {
+        'info' : {
+            'latitude' : latitude,
+            'longitude' : longitude,
+            'capacity' : 5.0,
+            'time' : moment.strftime('%m/%d/%Y %H:%M:%S'),
+        },
+        'inverter' : [ {
+            'sn' : '12345ESU123S1234',
+            'status' : 1 if power > 0 else -1,
+            'out_pac' : power,
+            'output_voltage' : '231.4V',
+            'eday' : solar_energy(moment),
+            'etotal' : 12345.6,
+            'd' : { 'vpv1' : 310.2 if power > 0 else 0, 'vpv2' : 0 },
+            'invert_full' : { 'buy' : 1.2, 'seller' : solar_energy(moment) / 2 },
+        } ],
+        'powerflow' : {
+            'load' : '{}(W)'.format(450 + power // 10),
+            'soc' : '0',
+        },
+        'energeStatisticsCharts' : {
+            'consumptionOfLoad' : round(0.45 * (moment.hour + moment.minute / 60), 2),
+        },
+    }
+
+def sems_day_pac(date):
+    ''' A GetPowerStationPacByDayForApp response, a reading each 5 minutes. '''
+    moments = [ date + timedelta(minutes=5 * i) for i in range(288) ]
+    return { 'pacs' : [ { 'date' : m.strftime('%m/%d/%Y %H:%M:%S'), 'pac' : solar_power(m) } for m in moments ] }
+
+def sems_chart(date):
+    ''' A GetChartByPlant response, with both the load line and the consumption total. '''
+    moments = [ date + timedelta(minutes=5 * i) for i in range(288) ]
+    load = [ { 'x' : m.strftime('%H:%M'), 'y' : 450 + solar_power(m) // 10 } for m in moments ]
+    return {
+        'lines' : [ {}, {}, {}, { 'xy' : load } ],
+        'modelData' : { 'consumptionOfLoad' : 10.8 },
+    }
+
+def weather_current(moment):
+    return { 'current' : { 'dt' : int(moment.timestamp()), 'temp' : 15.3 } }
+
+def weather_day(timestamp):
+    return { 'hourly' : [ { 'dt' : timestamp + 3600 * i, 'temp' : round(10 + 5 * math.sin(i / 4), 1) } for i in range(24) ] }
+
+class Server(ThreadingMixIn, HTTPServer):
+    # ThreadingHTTPServer needs Python 3.7
+    daemon_threads = True
+
+class StandIn:
+    ''' Local HTTP server answering like SEMS, PVOutput and OpenWeather do.
+
+    It serves SEMS under /api/, PVOutput under /service/r2/ and OpenWeather
+    under /data/2.5/, so the API clients can be pointed at it by their base
+    url. Readings are generated for the current time (or clock()), unless
+    responses maps an endpoint name to recorded data, or to a function of
+    the request parameters returning it. PVOutput answers with rate limit
+    headers counting down from rate_limit. Each response is delayed by
+    latency seconds, to resemble a real network. '''
+
+    def __init__(self, responses=None, latency=0, rate_limit=60, clock=None):
+        self.responses = responses or {}
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.clock = clock or datetime.now
+        self.lock = threading.Lock()
+        self.requests = []
+        self.used = 0
+        self.reset = time.time() + 3600
+        self.server = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}/'.format(*self.server.server_address[:2])
+
+    def start(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Send each response in one segment, like a real server
+            wbufsize = 65536
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                standin.handle(self)
+
+            def do_POST(self):
+                standin.handle(self)
+
+            def log_message(self, format, *args):
+                logging.debug("Stand-in: " + format % args)
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def handle(self, request):
+        url = urlsplit(request.path)
+        params = { key : values[0] for key, values in parse_qs(url.query).items() }
+        length = int(request.headers.get('Content-Length') or 0)
+        if length:
+            body = request.rfile.read(length).decode()
+            params.update({ key : values[0] for key, values in parse_qs(body, keep_blank_values=True).items() })
+        with self.lock:
+            self.requests.append((url.path, params))
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        path = url.path
+        if path.startswith('/api/'):
+            status, headers, body = self.sems(path[5:], params, request.headers.get('Token', ''))
+        elif path.startswith('/service/r2/'):
+            status, headers, body = self.pvoutput(path[12:], params)
+        elif path.startswith('/data/2.5/'):
+            status, headers, body = self.openweather(path[10:], params)
+        else:
+            status, headers, body = 404, {}, 'Not found'
+
+        if not isinstance(body, str):
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        data = body.encode()
+        request.send_response(status)
+        for name, value in headers.items():
+            request.send_header(name, value)
+        request.send_header('Content-Length', str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+    def respond(self, name, params, default):
+        response = self.responses.get(name)
+        if response is None:
+            return default()
+        return response(params) if callable(response) else response
+
+    def sems(self, endpoint, params, token):
+        if endpoint == 'v2/Common/CrossLogin':
+            data = { 'uid' : 'standin', 'timestamp' : int(time.time() * 1000), 'token' : TOKEN, 'client' : 'ios', 'version' : 'v3.1', 'language' : 'en' }
+            return 200, {}, { 'code' : 0, 'msg' : '', 'data' : data, 'api' : self.url + 'api/' }
+        if TOKEN not in token:
+            return 200, {}, { 'code' : 100001, 'msg' : 'The authorization has expired, please log in again.', 'data' : None }
+
+        now = self.clock()
+        if endpoint == 'v2/PowerStation/GetMonitorDetailByPowerstationId':
+            data = self.respond('GetMonitorDetailByPowerstationId', params, lambda: sems_detail(now))
+        elif endpoint == 'v2/PowerStationMonitor/GetPowerStationPacByDayForApp':
+            data = self.respond('GetPowerStationPacByDayForApp', params, lambda: sems_day_pac(datetime.strptime(params['date'], '%Y-%m-%d')))
+        elif endpoint == 'v2/Charts/GetChartByPlant':
+            data = self.respond('GetChartByPlant', params, lambda: sems_chart(datetime.strptime(params['date'], '%Y-%m-%d')))
+        else:
+            return 200, {}, { 'code' : 1, 'msg' : 'Unknown endpoint', 'data' : None }
+        return 200, {}, { 'code' : 0, 'msg' : '', 'data' : data }
+
+    def pvoutput(self, endpoint, params):
+        with self.lock:
+            if time.time() > self.reset:
+                self.used = 0
+                self.reset = time.time() + 3600
+            self.used += 1
+            remaining = self.rate_limit - self.used
+        headers = {
+            'X-Rate-Limit-Limit' : str(self.rate_limit),
+            'X-Rate-Limit-Remaining' : str(max(remaining, 0)),
+            'X-Rate-Limit-Reset' : str(int(self.reset)),
+        }
+        if remaining < 0:
+            return 403, headers, 'Forbidden 403: Exceeded 60 requests per hour'
+        if endpoint == 'addstatus.jsp':
+            return 200, headers, self.respond('addstatus', params, lambda: 'OK 200: Added Status')
+        if endpoint == 'addbatchstatus.jsp':
+            # Each reading is confirmed by its date, time and 1 when it was added
+            rows = [ row.split(',') for row in params.get('data', '').split(';') ]
+            return 200, headers, self.respond('addbatchstatus', params, lambda: ';'.join('{},{},1'.format(*row[:2]) for row in rows if len(row) > 1))
+        return 400, headers, 'Bad request 400: Unknown service'
+
+    def openweather(self, endpoint, params):
+        if endpoint == 'onecall':
+            return 200, {}, self.respond('onecall', params, lambda: weather_current(self.clock()))
+        if endpoint == 'onecall/timemachine':
+            return 200, {}, self.respond('timemachine', params, lambda: weather_day(int(params['dt'])))
+        return 404, {}, { 'cod' : 404, 'message' : 'Not found' }
+
+    def count(self, path):
+        ''' The number of requests received for path. '''
+        with self.lock:
+            return sum(1 for request_path, params in self.requests if request_path == path)
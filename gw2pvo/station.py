@@ -0,0 +1,55 @@
+import logging
+import threading
+import time
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+_current = threading.local()
+
+class Station:
+    ''' Settings and the state kept between cycles for one installation. '''
+
+    def __init__(self, name, settings):
+        self.name = name
+        self.settings = settings
+        self.last_eday_kwh = 0
+        self.last_energy_used = 0
+        self.mqtt_broker = None
+        self.resampler = None
+        self.smoothers = None
+        self.csv_writer = None
+        self.cycle = None
+        self.solar = None
+        # The time of a cycle, the trace time when replaying
+        self.clock = time.time
+
+    def label(self):
+        ''' The station in metrics: its section, or else its SEMS station ID or MQTT topic. '''
+        return self.name or self.settings.gw_station_id or self.settings.mqtt_topic or ''
+
+    def __enter__(self):
+        # Tag log records and metrics of the running thread with the station
+        self.previous = getattr(_current, 'station', None)
+        _current.station = self
+        return self
+
+    def __exit__(self, *exc):
+        _current.station = self.previous
+        return False
+
+def current():
+    ''' The label of the station the running thread works on, '' if none. '''
+    state = getattr(_current, 'station', None)
+    return state.label() if state else ''
+
+class StationLogFilter(logging.Filter):
+    ''' Add the station a thread is working on as %(station)s to log records. '''
+
+    def filter(self, record):
+        state = getattr(_current, 'station', None)
+        name = state.name if state else ''
+        record.station = '[{}] '.format(name) if name else ''
+        return True
@@ -0,0 +1,40 @@
+import bisect
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+class TemperatureSeries:
+    ''' Time sorted temperature samples with binary search lookup.
+
+    Samples are dicts with a 'time' (epoch seconds) and a 'temperature', as
+    returned by the weather APIs' get_temperature_for_day. '''
+
+    def __init__(self, samples, interpolate=False):
+        points = sorted(
+            (sample['time'], sample['temperature'])
+            for sample in samples or []
+            if sample.get('time') is not None and sample.get('temperature') is not None
+        )
+        self.times = [ point[0] for point in points ]
+        self.values = [ point[1] for point in points ]
+        self.interpolate = interpolate
+
+    def __len__(self):
+        return len(self.times)
+
+    def at(self, timestamp):
+        ''' The temperature at timestamp, None if it is before the first sample.
+
+        Without interpolation this is the most recent sample at or before
+        timestamp, otherwise the linear interpolation between the samples
+        around it. '''
+        i = bisect.bisect_right(self.times, timestamp)
+        if i == 0:
+            return None
+        if self.interpolate and i < len(self.times):
+            t0, t1 = self.times[i - 1], self.times[i]
+            v0, v1 = self.values[i - 1], self.values[i]
+            return round(v0 + (v1 - v0) * (timestamp - t0) / (t1 - t0), 1)
+        return self.values[i - 1]
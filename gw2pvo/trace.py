@@ -0,0 +1,54 @@
+import json
+import threading
+import time
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+class Recorder:
+    ''' Append the raw inputs of the pipeline to a file, one JSON object per line.
+
+    Each record holds the time it was received, its kind ('sems' for a
+    GetMonitorDetailByPowerstationId response, 'mqtt' for a message), the
+    station it belongs to and the data itself. '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.file = open(filename, 'a')
+
+    def record(self, kind, station, data):
+        line = json.dumps({ 'time' : time.time(), 'kind' : kind, 'station' : station, 'data' : data })
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+_recorder = None
+
+def start_recording(filename):
+    global _recorder
+    _recorder = Recorder(filename)
+
+def stop_recording():
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+        _recorder = None
+
+def record(kind, station, data):
+    ''' Record an input, if recording. '''
+    if _recorder is not None:
+        _recorder.record(kind, station, data)
+
+def read(filename):
+    ''' The records of a trace, one at a time. '''
+    with open(filename) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
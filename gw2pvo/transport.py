@@ -0,0 +1,76 @@
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+class Transport:
+    ''' Keep-alive HTTP connections shared by all API clients.
+
+    Each host gets its own connection pool, so consecutive calls to SEMS,
+    PVOutput or the weather services reuse an open TCP/TLS connection. '''
+
+    def __init__(self, pool_size=10, timeout=15):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def stats(self):
+        ''' Count connections opened versus requests served from a pooled connection. '''
+        opened = 0
+        requested = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            requested += pool.num_requests
+        return {
+            'hosts' : len(pools),
+            'opened' : opened,
+            'reused' : max(requested - opened, 0),
+        }
+
+    def log_stats(self):
+        logging.debug("HTTP connections: {opened} opened, {reused} reused over {hosts} hosts".format(**self.stats()))
+
+    def close(self):
+        self.session.close()
+
+_lock = threading.Lock()
+_transport = None
+
+def configure(pool_size=10, timeout=15):
+    ''' Replace the process wide transport, e.g. with settings from the command line. '''
+    global _transport
+    with _lock:
+        if _transport is not None:
+            _transport.close()
+        _transport = Transport(pool_size, timeout)
+        return _transport
+
+def get_transport():
+    global _transport
+    with _lock:
+        if _transport is None:
+            _transport = Transport()
+        return _transport
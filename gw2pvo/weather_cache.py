@@ -0,0 +1,96 @@
+import logging
+import threading
+import time
+
+from gw2pvo import cache
+
+__author__ = "Mark Ruys"
+__copyright__ = "Copyright 2020, Mark Ruys"
+__license__ = "MIT"
+__email__ = "mark@paracas.nl"
+
+class WeatherCache:
+    ''' Outside temperatures per location, reused for ttl seconds.
+
+    An expired temperature is still returned while a background thread
+    fetches a new one, so uploads never wait for the weather API. Only when
+    nothing usable is cached the temperature is fetched right away, waiting
+    at most timeout seconds when given. With a filename the cache is shared
+    between cron runs. '''
+
+    def __init__(self, ttl=1800, filename=None):
+        self.ttl = ttl
+        self.max_stale = 4 * ttl
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.refreshing = {}
+        self.entries = {}
+        if filename:
+            data = cache.read_json(filename, {})
+            self.entries = data if isinstance(data, dict) else {}
+
+    def key(self, latitude, longitude):
+        # About a kilometer, which is as precise as the weather services are
+        return "{:.2f},{:.2f}".format(float(latitude), float(longitude))
+
+    def get(self, latitude, longitude, fetch, timeout=None):
+        if latitude is None or longitude is None:
+            return None
+        key = self.key(latitude, longitude)
+        with self.lock:
+            entry = self.entries.get(key)
+
+        age = time.time() - entry['time'] if entry else None
+        if age is None or age > self.max_stale:
+            if timeout is None:
+                return self.refresh(key, fetch)
+            self.refresh_in_background(key, fetch).join(timeout)
+            with self.lock:
+                entry = self.entries.get(key)
+            if entry is None or time.time() - entry['time'] > self.max_stale:
+                logging.warning("No temperature within {:.1f} seconds".format(timeout))
+                return None
+            return entry['temperature']
+
+        if age > self.ttl:
+            self.refresh_in_background(key, fetch)
+
+        return entry['temperature']
+
+    def refresh_in_background(self, key, fetch):
+        ''' The thread refreshing key, started unless one is already running. '''
+        with self.lock:
+            thread = self.refreshing.get(key)
+            if thread is None:
+                # Not a daemon thread, so a cron run finishes the refresh before exiting
+                thread = threading.Thread(target=self.refresh, args=(key, fetch), name="weather-refresh")
+                self.refreshing[key] = thread
+                thread.start()
+        return thread
+
+    def refresh(self, key, fetch):
+        try:
+            temperature = fetch()
+        except Exception as exp:
+            logging.warning("Failed to fetch temperature - " + str(exp))
+            temperature = None
+        with self.lock:
+            self.refreshing.pop(key, None)
+            if temperature is None:
+                return None
+            self.entries[key] = {
+                'temperature' : temperature,
+                'time' : time.time(),
+            }
+            entries = dict(self.entries)
+        logging.debug("Temperature at {} is {}".format(key, temperature))
+        self.save(entries)
+        return temperature
+
+    def save(self, entries):
+        if not self.filename:
+            return
+        try:
+            cache.write_json(self.filename, entries)
+        except OSError as exp:
+            logging.warning("Failed to save weather cache to {}: {}".format(self.filename, exp))
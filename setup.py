@@ -65,7 +65,7 @@ setup(
 
     # You can just specify the packages manually here if your project is
     # simple. Or you can use find_packages().
-    packages=find_packages(exclude=['contrib', 'docs', 'tests']),
+    packages=find_packages(exclude=['contrib', 'docs', 'tests', 'benchmarks', 'benchmarks.*']),
 
     # Alternatively, if you want to distribute just a my_module.py, uncomment
     # this:
@@ -75,7 +75,7 @@ setup(
     # your project is installed. For an analysis of "install_requires" vs pip's
     # requirements files see:
     # https://packaging.python.org/en/latest/requirements.html
-    install_requires=['astral>=2', 'requests', 'oauthlib', 'requests-oauthlib', 'python-telegram-bot'],
+    install_requires=['astral>=2', 'requests', 'oauthlib', 'requests-oauthlib', 'python-telegram-bot', 'numpy'],
 
     # Astral >=2 requires Python>=3.6
     python_requires='>=3.6',
@@ -0,0 +1,29 @@
+import pytest
+
+class Clock:
+    ''' A monotonic and a wall clock which only move when told to. '''
+
+    def __init__(self, wall):
+        self.now = 1000.0
+        self.offset = wall - self.now
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now + self.offset
+
+    def sleep(self, seconds):
+        self.now += max(seconds, 0)
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def set_wall(self, seconds):
+        ''' Set the wall clock forward (or back), like NTP could. '''
+        self.offset += seconds
+
+@pytest.fixture
+def clock():
+    # 2020-06-01 08:26:40 UTC, 100 seconds after a 5 minute boundary
+    return Clock(1591000000.0)
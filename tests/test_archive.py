@@ -0,0 +1,56 @@
+import time
+from datetime import datetime
+
+import numpy as np
+
+from gw2pvo import archive
+from gw2pvo.day_readings import DayReadings
+
+def moment(hour, minute=0):
+    return time.mktime(datetime(2020, 6, 1, hour, minute).timetuple())
+
+def day():
+    return DayReadings(
+        np.array([ datetime(2020, 6, 1, 12, m) for m in (0, 5, 10) ], dtype='datetime64[s]'),
+        np.array([ 1000, 1500, 800 ]),
+        np.array([ 300, 350, 400 ]),
+        np.array([ 1.0, 1.1, 1.2 ]),
+        np.array([ 2.0, 2.1, 2.2 ]),
+    )
+
+def test_day_round_trip(tmp_path):
+    store = archive.Archive(str(tmp_path / 'archive.sqlite'))
+    store.add_day('1', day())
+    readings = store.day_readings('1', moment(0), moment(23))
+    assert list(readings) == list(day())
+    assert len(store.day_readings('2', moment(0), moment(23))) == 0
+    store.close()
+
+def test_live_reading_replaces_the_same_time(tmp_path):
+    store = archive.Archive(str(tmp_path / 'archive.sqlite'))
+    store.add_day('1', day())
+    store.add('1', moment(12, 5), { 'pgrid_w' : 1600, 'load' : 360, 'eday_kwh' : 1.15, 'energy_used' : 2.15, 'temperature' : 21.5, 'grid_voltage' : 231.04, 'pv_voltage' : 400 })
+    rows = store.rows('1', moment(12, 5), moment(12, 10))
+    assert rows == [ {
+        'time' : moment(12, 5), 'pgrid_w' : 1600, 'load' : 360, 'eday_kwh' : 1.15, 'energy_used' : 2.15,
+        'temperature' : 21.5, 'grid_voltage' : 231.04, 'pv_voltage' : 400,
+    } ]
+    assert list(store.csv_rows('1', moment(12, 5), moment(12, 10), pv_voltage=False)) == [ {
+        'date' : '2020-06-01 12:05', 'eday_kwh' : 1.15, 'pgrid_w' : 1600, 'energy_used' : 2.15, 'load' : 360,
+        'temp' : 21.5, 'voltage' : 231.0,
+    } ]
+    assert [ row['voltage'] for row in store.csv_rows('1', moment(12, 5), moment(12, 10), pv_voltage=True) ] == [ 400 ]
+    assert [ row['temp'] for row in store.csv_rows('1', moment(12), moment(12, 5)) ] == [ '' ]
+    store.close()
+
+def test_persists_between_runs(tmp_path):
+    filename = str(tmp_path / 'archive.sqlite')
+    store = archive.Archive(filename)
+    store.add_day('1', day())
+    store.close()
+    store = archive.Archive(filename)
+    assert store.daily('1', moment(0), moment(23)) == [ {
+        'date' : '2020-06-01', 'readings' : 3, 'eday_kwh' : 1.2, 'energy_used' : 2.2, 'peak_w' : 1500,
+        'average_load' : 350, 'temperature_min' : None, 'temperature_max' : None,
+    } ]
+    store.close()
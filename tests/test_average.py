@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from gw2pvo.average import ExponentialMovingAverage, MovingAverage, smoother
+
+SAMPLES = [ 100, 400, 250, 0, 800, 300, 300, 50, 900, 10 ]
+
+def weighted(window):
+    weights = range(1, len(window) + 1)
+    return sum(w * x for w, x in zip(weights, window)) / sum(weights)
+
+def test_wma_weighs_recent_samples_most():
+    average = MovingAverage(3)
+    # The window starts filled with the first sample
+    assert average.add(100) == 100
+    assert average.add(400) == pytest.approx(weighted([100, 100, 400]))
+    assert average.add(250) == pytest.approx(weighted([100, 400, 250]))
+    assert average.add(0) == pytest.approx(weighted([400, 250, 0]))
+    assert average.window() == [400, 250, 0]
+
+def test_ema_follows_alpha():
+    average = ExponentialMovingAverage(3)
+    assert average.alpha == 0.5
+    assert average.add(100) == 100
+    assert average.add(400) == 250
+    assert average.add(250) == 250
+    assert average.add(0) == 125
+
+@pytest.mark.parametrize('kind', ['wma', 'ema'])
+@pytest.mark.parametrize('n', [1, 3, 12])
+def test_add_many_matches_add(kind, n):
+    one = smoother(kind, n)
+    many = smoother(kind, n)
+    expected = [ one.add(x) for x in SAMPLES ]
+    assert many.add_many(SAMPLES[:4]) == pytest.approx(expected[:4])
+    # And continues where it left off
+    assert many.add_many(SAMPLES[4:]) == pytest.approx(expected[4:])
+    assert many.add(7) == pytest.approx(one.add(7))
+
+def test_ema_add_many_keeps_long_series_finite():
+    averages = smoother('ema', 50).add_many(np.full(10000, 1000.0))
+    assert np.all(np.isfinite(averages))
+    assert averages[-1] == pytest.approx(1000)
+
+def test_window_of_one_does_not_smooth():
+    for kind in ['wma', 'ema']:
+        assert list(smoother(kind, 1).add_many(SAMPLES)) == SAMPLES
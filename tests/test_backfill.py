@@ -0,0 +1,84 @@
+import time
+
+from datetime import datetime
+
+import requests
+
+from gw2pvo import backfill
+from gw2pvo import pvo_api
+
+DAYS = backfill.date_range(datetime(2020, 6, 1), datetime(2020, 6, 3))
+
+class GoodWe:
+
+    def __init__(self, failing=()):
+        self.failing = failing
+
+    def getDayReadings(self, date):
+        if date in self.failing:
+            raise Exception("SEMS is down")
+        return { 'entries' : [ { 'dt' : date, 'pgrid_w' : 100, 'eday_kwh' : 1.0, 'energy_used' : 2.0, 'load' : 300 } ] }
+
+class PVOutput:
+
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.days = []
+
+    def add_day(self, entries, temperatures):
+        if entries[0]['dt'] in self.failing:
+            return False
+        self.days.append(entries[0]['dt'])
+        return True
+
+class Response:
+
+    def __init__(self, status_code, text=''):
+        self.status_code = status_code
+        self.reason = text
+        self.text = text
+        self.headers = {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(self.text, response=self)
+
+class Transport:
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.posts = 0
+
+    def post(self, url, headers=None, data=None):
+        self.posts += 1
+        return Response(self.status_code, 'Bad request 400: Invalid data')
+
+def test_all_days_copied():
+    pvo = PVOutput()
+    assert backfill.Backfill(GoodWe(), pvo).run(DAYS)
+    assert sorted(pvo.days) == DAYS
+
+def test_failed_fetch_fails_the_run():
+    pvo = PVOutput()
+    assert not backfill.Backfill(GoodWe(failing=[DAYS[1]]), pvo).run(DAYS)
+    assert sorted(pvo.days) == [DAYS[0], DAYS[2]]
+
+def test_failed_upload_fails_the_run():
+    pvo = PVOutput(failing=[DAYS[2]])
+    assert not backfill.Backfill(GoodWe(), pvo).run(DAYS)
+    assert sorted(pvo.days) == DAYS[:2]
+
+def test_add_day_reports_a_failed_batch():
+    transport = Transport(400)
+    # Without time left, a failed request is not retried
+    pvo = pvo_api.PVOutputApi(None, None, 'test-add-day', 'key', transport=transport, batch_size=2, deadline=time.monotonic())
+    entries = GoodWe().getDayReadings(DAYS[0])['entries'] * 3
+    assert not pvo.add_day(entries, None)
+    assert transport.posts == 1
+
+def test_add_day_uploads_in_batches():
+    transport = Transport(200)
+    pvo = pvo_api.PVOutputApi(None, None, 'test-add-day-ok', 'key', transport=transport, batch_size=2)
+    entries = GoodWe().getDayReadings(DAYS[0])['entries'] * 3
+    assert pvo.add_day(entries, None)
+    assert transport.posts == 2
@@ -0,0 +1,46 @@
+import random
+from datetime import datetime
+
+import pytest
+
+from benchmarks.day_readings import dict_readings, sems_day
+from gw2pvo.day_readings import DayReadings
+
+@pytest.mark.parametrize('energy_used', [0, 12.5])
+def test_matches_the_dict_loop(energy_used):
+    random.seed(1)
+    pacs, xy = sems_day(datetime(2020, 6, 1))
+    old = dict_readings(pacs, xy, energy_used)
+    new = list(DayReadings.from_sems(pacs, xy, energy_used))
+    assert len(old) == len(new)
+    for a, b in zip(old, new):
+        assert a['dt'] == b['dt'] and a['pgrid_w'] == b['pgrid_w'] and a['load'] == b['load']
+        # NumPy rounds halfway cases in binary
+        assert a['eday_kwh'] == pytest.approx(b['eday_kwh'], abs=0.0011)
+        assert a['energy_used'] == pytest.approx(b['energy_used'], abs=0.01)
+
+def test_leaves_out_negative_power():
+    pacs = [
+        { 'date' : '06/01/2020 06:00:00', 'pac' : -1 },
+        { 'date' : '06/01/2020 07:00:00', 'pac' : 1000 },
+        { 'date' : '06/01/2020 08:00:00', 'pac' : 2000 },
+    ]
+    xy = [ { 'y' : 500 } ] * 3
+    readings = DayReadings.from_sems(pacs, xy)
+    assert [ r['dt'] for r in readings ] == [ datetime(2020, 6, 1, 7), datetime(2020, 6, 1, 8) ]
+    assert [ r['eday_kwh'] for r in readings ] == [ 1.0, 3.0 ]
+    assert readings[-1]['energy_used'] == 1.0
+
+def test_indexing_and_slicing():
+    random.seed(2)
+    readings = DayReadings.from_sems(*sems_day(datetime(2020, 6, 1)))
+    part = readings[10:20]
+    assert isinstance(part, DayReadings)
+    assert len(part) == 10
+    assert part[0] == readings[10]
+    assert list(part) == [ readings[i] for i in range(10, 20) ]
+
+def test_empty_day():
+    readings = DayReadings.from_sems([], [])
+    assert len(readings) == 0
+    assert list(readings) == []
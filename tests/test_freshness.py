@@ -0,0 +1,33 @@
+from gw2pvo import freshness
+
+def test_unchanged_reading_is_not_new():
+    f = freshness.Freshness()
+    assert f.update(1000, 1030)
+    assert not f.update(1000, 1330)
+    assert not f.update(990, 1330)
+    assert f.update(1300, 1340)
+
+def test_cadence_needs_a_few_readings():
+    f = freshness.Freshness()
+    f.update(1000, 1030)
+    f.update(1300, 1330)
+    assert f.cadence() is None
+    assert f.expected() is None
+    f.update(1600, 1620)
+    assert f.cadence() == 300
+    # The next reading is taken at 1900, and received after the shortest delay seen
+    assert f.expected() == 1900 + 20
+
+def test_cadence_ignores_a_missed_reading():
+    f = freshness.Freshness()
+    for taken in (1000, 1300, 1600, 2200, 2500):
+        f.update(taken, taken + 10)
+    assert f.cadence() == 300
+
+def test_store_keeps_the_history(tmp_path):
+    filename = str(tmp_path / 'freshness.json')
+    store = freshness.FreshnessStore(filename)
+    for taken in (1000, 1300, 1600):
+        assert store.update('station', taken, taken + 30)
+    assert not store.update('station', 1600, 1900)
+    assert freshness.FreshnessStore(filename).get('station').expected() == 1600 + 300 + 30
@@ -0,0 +1,56 @@
+import datetime
+import time
+import types
+
+from gw2pvo import gw_csv
+
+ROW = { 'date' : '2020-06-01 12:00:00', 'eday_kwh' : 1.5, 'pgrid_w' : 900, 'energy_used' : 2.0, 'load' : 400 }
+
+def lines(path):
+    with open(str(path), encoding='utf-8-sig') as f:
+        return f.read().splitlines()
+
+def test_rows_are_flushed_by_the_timer(tmp_path):
+    path = tmp_path / 'gw.csv'
+    writer = gw_csv.GoodWeCSV(str(path), flush_interval=0.1)
+    writer.append(ROW)
+    writer.append(ROW)
+    assert lines(path) == []
+    time.sleep(0.3)
+    assert len(lines(path)) == 3
+    assert writer.timer is None
+    writer.close()
+
+def test_header_is_written_once(tmp_path):
+    path = tmp_path / 'gw.csv'
+    for i in range(2):
+        writer = gw_csv.GoodWeCSV(str(path), flush_interval=60)
+        writer.append(ROW)
+        writer.close()
+    assert lines(path) == [
+        'date,eday_kwh,pgrid_w,energy_used,load,temp,voltage',
+        '2020-06-01 12:00:00,1.5,900,2.0,400,,',
+        '2020-06-01 12:00:00,1.5,900,2.0,400,,',
+    ]
+
+def test_rotates_at_midnight(tmp_path, monkeypatch):
+    today = [ datetime.date(2020, 6, 1) ]
+    class Date(datetime.date):
+        @classmethod
+        def today(cls):
+            return today[0]
+    monkeypatch.setattr(gw_csv, 'datetime', types.SimpleNamespace(date=Date))
+
+    writer = gw_csv.GoodWeCSV(str(tmp_path / 'gw-DATE.csv'), flush_interval=60)
+    writer.append(ROW)
+    today[0] = datetime.date(2020, 6, 2)
+    writer.append(ROW)
+    writer.append(ROW)
+    writer.close()
+    assert len(lines(tmp_path / 'gw-2020-06-01.csv')) == 2
+    assert len(lines(tmp_path / 'gw-2020-06-02.csv')) == 3
+
+def test_shared_writer(tmp_path):
+    filename = str(tmp_path / 'gw.csv')
+    assert gw_csv.get_writer(filename) is gw_csv.get_writer(filename)
+    gw_csv.close_all()
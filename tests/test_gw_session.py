@@ -0,0 +1,87 @@
+import json
+
+import pytest
+import requests
+
+from gw2pvo import gw_api
+from gw2pvo.gw_session import SessionStore
+
+GLOBAL_URL = 'https://global.example/api/'
+
+class Response:
+
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+class Transport:
+    ''' SEMS with the account at eu.example, and a token that expires when told. '''
+
+    def __init__(self, dead=(), login=True):
+        self.dead = dead
+        self.login = login
+        self.valid_token = None
+        self.posts = []
+
+    def post(self, url, headers=None, data=None):
+        self.posts.append((url, headers['Token']))
+        if any(url.startswith(dead) for dead in self.dead):
+            raise requests.exceptions.ConnectionError("Connection refused")
+        if url == GLOBAL_URL + 'v2/Common/CrossLogin':
+            if not self.login:
+                return Response({ 'code' : 100005, 'msg' : 'Wrong password' })
+            self.valid_token = json.dumps({ 'uid' : 'u', 'token' : 't{}'.format(len(self.posts)) })
+            return Response({ 'code' : 0, 'api' : 'https://eu.example/api/', 'data' : json.loads(self.valid_token) })
+        if headers['Token'] != self.valid_token:
+            return Response({ 'code' : 100001, 'data' : None })
+        return Response({ 'code' : 0, 'data' : { 'ok' : True } })
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(gw_api.time, 'sleep', lambda seconds: None)
+
+def api(transport, store):
+    return gw_api.GoodWeApi('station', 'account', 'password', store, transport=transport, global_url=GLOBAL_URL)
+
+def test_reuses_the_cached_login(tmp_path):
+    store = SessionStore(str(tmp_path / 'session.json'))
+    transport = Transport()
+    assert api(transport, store).call('v1/Test', {}) == { 'ok' : True }
+    assert [ url for url, token in transport.posts ] == [
+        GLOBAL_URL + 'v1/Test', GLOBAL_URL + 'v2/Common/CrossLogin', 'https://eu.example/api/v1/Test' ]
+
+    # A next run goes straight to the regional server
+    transport.posts = []
+    assert api(transport, SessionStore(str(tmp_path / 'session.json'))).call('v1/Test', {}) == { 'ok' : True }
+    assert transport.posts == [ ('https://eu.example/api/v1/Test', transport.valid_token) ]
+
+def test_logs_in_again_when_the_token_expired():
+    store = SessionStore()
+    store.set('account', 'https://eu.example/api/', 'expired')
+    transport = Transport()
+    assert api(transport, store).call('v1/Test', {}) == { 'ok' : True }
+    assert [ url for url, token in transport.posts ] == [
+        'https://eu.example/api/v1/Test', GLOBAL_URL + 'v2/Common/CrossLogin', 'https://eu.example/api/v1/Test' ]
+    assert store.get('account')['token'] == transport.valid_token
+
+def test_falls_back_to_the_global_server():
+    store = SessionStore()
+    store.set('account', 'https://gone.example/api/', 'token')
+    transport = Transport(dead=['https://gone.example/'])
+    assert api(transport, store).call('v1/Test', {}) == { 'ok' : True }
+    assert [ url for url, token in transport.posts ] == [
+        'https://gone.example/api/v1/Test', GLOBAL_URL + 'v2/Common/CrossLogin', 'https://eu.example/api/v1/Test' ]
+    assert transport.posts[1][1] == gw_api.ANONYMOUS_TOKEN
+    assert store.get('account')['base_url'] == 'https://eu.example/api/'
+
+def test_failed_login_forgets_the_session():
+    store = SessionStore()
+    store.set('account', 'https://eu.example/api/', 'expired')
+    with pytest.raises(Exception, match='Wrong password'):
+        api(Transport(login=False), store).call('v1/Test', {})
+    assert store.get('account') is None
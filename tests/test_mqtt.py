@@ -0,0 +1,68 @@
+import pytest
+
+# paho-mqtt is not a dependency of the package
+pytest.importorskip('paho.mqtt.client')
+
+from gw2pvo import mqtt
+
+READINGS = {
+    'work_mode_label' : 'Normal',
+    'pv_daily' : '12.5',
+    'ppv' : '1500',
+    'house_consumption_daily' : '8.1',
+    'house_consumption' : '450',
+    'outside_temperature' : '21.0',
+    'vgrid' : '231.2',
+    'vpv1' : '380.5',
+    'date' : '2020-06-01T12:00:00',
+}
+
+def broker(clock, max_age=300):
+    m = mqtt.MQTT(None, None, 'localhost', None, None, None, 'gw', timeout=1, max_age=max_age, clock=clock.time)
+    m.connected.set()
+    return m
+
+def publish(m, readings):
+    for key, value in readings.items():
+        m.receive('gw/inverter/' + key, value)
+
+def test_fresh_readings(clock):
+    m = broker(clock)
+    publish(m, READINGS)
+    assert m.wait_for_readings(0) == READINGS
+
+def test_missing_reading(clock):
+    m = broker(clock)
+    publish(m, { key : value for key, value in READINGS.items() if key != 'vpv1' })
+    with pytest.raises(Exception, match="Failed to get 'vpv1' values"):
+        m.wait_for_readings(0)
+
+def test_stale_reading(clock):
+    m = broker(clock)
+    publish(m, READINGS)
+    clock.advance(200)
+    publish(m, { key : value for key, value in READINGS.items() if key != 'ppv' })
+    clock.advance(200)
+    with pytest.raises(Exception, match="No new 'ppv' value from mqtt broker in the last 400 seconds"):
+        m.wait_for_readings(0)
+    publish(m, { 'ppv' : '1600' })
+    assert m.wait_for_readings(0)['ppv'] == '1600'
+
+def test_without_max_age_readings_never_go_stale(clock):
+    m = broker(clock, max_age=None)
+    publish(m, READINGS)
+    clock.advance(86400)
+    assert m.wait_for_readings(0) == READINGS
+
+def test_disconnected(clock):
+    m = broker(clock)
+    m.connected.clear()
+    with pytest.raises(Exception, match="Unable to connect mqtt broker"):
+        m.wait_for_readings(0)
+
+def test_other_topics_are_ignored(clock):
+    m = broker(clock)
+    publish(m, READINGS)
+    clock.advance(400)
+    m.receive('other/inverter/ppv', '1')
+    assert m.stale_keys(clock.time() - 300) == list(mqtt.REQUIRED_KEYS)
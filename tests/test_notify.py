@@ -0,0 +1,57 @@
+import threading
+
+from gw2pvo import notify
+
+def notifier(tmp_path=None, window=3600):
+    ''' A notifier collecting the messages instead of sending them, once released. '''
+    filename = str(tmp_path / 'telegram.json') if tmp_path else None
+    n = notify.Notifier('token', 'chat', window, filename)
+    n.messages = []
+    n.release = threading.Event()
+    n.release.set()
+    def send_all():
+        n.release.wait()
+        n.messages.extend(iter(n.next_message, None))
+    n.send_all = send_all
+    return n
+
+def test_repeated_messages_are_coalesced():
+    n = notifier()
+    assert n.notify('SEMS is down')
+    assert not n.notify('SEMS is down')
+    assert not n.notify('SEMS is down')
+    assert n.notify('PVOutput is down')
+    n.close(5)
+    assert n.messages == ['SEMS is down', 'PVOutput is down']
+    assert n.sent['SEMS is down']['repeated'] == 2
+
+def test_repeats_are_mentioned_after_the_window():
+    n = notifier()
+    n.notify('SEMS is down')
+    n.notify('SEMS is down')
+    n.sent['SEMS is down']['time'] -= 3600
+    assert n.notify('SEMS is down')
+    n.close(5)
+    assert n.messages[1].startswith('SEMS is down (repeated 1 times since ')
+    assert n.sent['SEMS is down']['repeated'] == 0
+
+def test_remembered_between_runs(tmp_path):
+    n = notifier(tmp_path)
+    assert n.notify('SEMS is down')
+    n.close(5)
+    n = notifier(tmp_path)
+    assert not n.notify('SEMS is down')
+    assert n.sent['SEMS is down']['repeated'] == 1
+
+def test_dropped_message_is_not_recorded():
+    n = notifier()
+    n.release.clear()
+    for i in range(notify.MAX_QUEUED):
+        assert n.notify('message {}'.format(i))
+    assert not n.notify('dropped')
+    assert 'dropped' not in n.sent
+    n.release.set()
+    n.close(5)
+    assert n.notify('dropped')
+    n.close(5)
+    assert n.messages[-1] == 'dropped'
@@ -0,0 +1,51 @@
+from gw2pvo import outbox
+
+DAY = 86400
+
+def queue(tmp_path, clock, **kwargs):
+    return outbox.Outbox(str(tmp_path / 'outbox.sqlite'), clock=clock.time, **kwargs)
+
+def test_peek_in_time_order(tmp_path, clock):
+    q = queue(tmp_path, clock)
+    now = clock.time()
+    q.put('1', now - 300, 'b')
+    q.put('1', now - 600, 'a')
+    q.put('1', now, 'c')
+    q.put('2', now, 'other system')
+    assert [ line for id, line in q.peek('1', 10) ] == ['a', 'b', 'c']
+    assert [ line for id, line in q.peek('1', 2, newest=True) ] == ['c', 'b']
+    assert q.count('1') == 3
+
+def test_same_time_keeps_insertion_order(tmp_path, clock):
+    q = queue(tmp_path, clock)
+    for line in ('a', 'b', 'c'):
+        q.put('1', clock.time(), line)
+    assert [ line for id, line in q.peek('1', 10) ] == ['a', 'b', 'c']
+
+def test_remove(tmp_path, clock):
+    q = queue(tmp_path, clock)
+    for i in range(3):
+        q.put('1', clock.time() + i, str(i))
+    q.remove([ id for id, line in q.peek('1', 2) ])
+    assert [ line for id, line in q.peek('1', 10) ] == ['2']
+
+def test_expired_readings_are_dropped(tmp_path, clock):
+    q = queue(tmp_path, clock, max_age_days=14)
+    q.put('1', clock.time() - 13 * DAY, 'recent')
+    q.put('1', clock.time() - 15 * DAY, 'expired')
+    assert [ line for id, line in q.peek('1', 10) ] == ['recent']
+    clock.advance(2 * DAY)
+    q.put('1', clock.time(), 'new')
+    assert [ line for id, line in q.peek('1', 10) ] == ['new']
+
+def test_keeps_the_newest_rows(tmp_path, clock):
+    q = queue(tmp_path, clock, max_rows=2)
+    for i in range(4):
+        q.put('1', clock.time() + i, str(i))
+    assert [ line for id, line in q.peek('1', 10) ] == ['2', '3']
+
+def test_survives_a_restart(tmp_path, clock):
+    q = queue(tmp_path, clock)
+    q.put('1', clock.time(), 'a')
+    q.close()
+    assert [ line for id, line in queue(tmp_path, clock).peek('1', 10) ] == ['a']
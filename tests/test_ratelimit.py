@@ -0,0 +1,75 @@
+from gw2pvo import ratelimit
+
+def limiter(clock, remaining, reset_in=1800):
+    limiter = ratelimit.RateLimiter(limit=60, reserve=10, clock=clock.time)
+    limiter.update({
+        'X-Rate-Limit-Limit' : '60',
+        'X-Rate-Limit-Remaining' : str(remaining),
+        'X-Rate-Limit-Reset' : str(clock.time() + reset_in),
+    })
+    return limiter
+
+def test_live_takes_a_token(clock):
+    l = limiter(clock, 20)
+    assert l.acquire(ratelimit.LIVE, 0)
+    assert l.tokens == 19
+
+def test_batch_leaves_the_reserve(clock):
+    l = limiter(clock, 11)
+    assert l.acquire(ratelimit.BATCH, 0)
+    assert l.tokens == 10
+    clock.advance(600)
+    assert not l.acquire(ratelimit.BATCH, 0)
+    assert not l.available(ratelimit.BATCH)
+    assert l.acquire(ratelimit.LIVE, 0)
+
+def test_live_uses_the_reserve(clock):
+    l = limiter(clock, 10)
+    for i in range(10):
+        assert l.acquire(ratelimit.LIVE, 0)
+    assert not l.acquire(ratelimit.LIVE, 0)
+    assert not l.available(ratelimit.LIVE)
+
+def test_refills_at_reset(clock):
+    l = limiter(clock, 0, reset_in=600)
+    assert not l.acquire(ratelimit.LIVE, 0)
+    clock.advance(600)
+    assert l.acquire(ratelimit.LIVE, 0)
+    assert l.tokens == 59
+
+def test_batches_burst_while_the_budget_covers_them(clock):
+    l = limiter(clock, 51)
+    for i in range(41):
+        assert l.acquire(ratelimit.BATCH, 0, pending=41 - i)
+    assert l.tokens == 10
+    assert not l.acquire(ratelimit.BATCH, 0)
+
+def test_batches_are_paced_when_more_are_pending(clock):
+    l = limiter(clock, 51, reset_in=1800)
+    assert l.acquire(ratelimit.BATCH, 0, pending=100)
+    # 40 batch requests left for the remaining 1800 seconds
+    assert l.next_batch == clock.time() + 45
+    assert not l.acquire(ratelimit.BATCH, 0, pending=99)
+    assert l.available(ratelimit.BATCH)
+    clock.advance(44)
+    assert not l.acquire(ratelimit.BATCH, 0, pending=99)
+    clock.advance(1)
+    assert l.acquire(ratelimit.BATCH, 0, pending=99)
+
+def test_live_is_not_paced(clock):
+    l = limiter(clock, 51)
+    assert l.acquire(ratelimit.BATCH, 0, pending=100)
+    assert l.acquire(ratelimit.LIVE, 0)
+    assert l.acquire(ratelimit.LIVE, 0)
+
+def test_exhaust_holds_back_until_reset(clock):
+    l = limiter(clock, 30)
+    l.exhaust(clock.time() + 120)
+    assert not l.acquire(ratelimit.LIVE, 0)
+    clock.advance(120)
+    assert l.acquire(ratelimit.LIVE, 0)
+
+def test_exhaust_without_reset_waits_an_hour(clock):
+    l = ratelimit.RateLimiter(clock=clock.time)
+    l.exhaust()
+    assert l.reset == clock.time() + 3600
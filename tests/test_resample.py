@@ -0,0 +1,43 @@
+from gw2pvo import resample
+
+def resampler(slack=0):
+    return resample.Resampler(300, mean=('pgrid_w',), last=('eday_kwh',), extremes=('pgrid_w',), slack=slack)
+
+def sample(pgrid_w, eday_kwh=1.0):
+    return { 'pgrid_w' : pgrid_w, 'eday_kwh' : eday_kwh }
+
+def test_bucket_closes_at_its_end():
+    r = resampler()
+    r.add(1210, sample(100, 1.0))
+    r.add(1320, sample(300, 1.1))
+    assert r.close(1499) == []
+    buckets = r.close(1500)
+    assert buckets == [{ 'time' : 1500, 'pgrid_w' : 200, 'eday_kwh' : 1.1, 'pgrid_w_min' : 100, 'pgrid_w_max' : 300 }]
+    assert r.close(1800) == []
+
+def test_later_sample_closes_the_bucket():
+    r = resampler()
+    r.add(1210, sample(100))
+    r.add(1510, sample(200))
+    r.add(1810, sample(300))
+    assert [ (b['time'], b['pgrid_w']) for b in r.close(1800) ] == [(1500, 100), (1800, 200)]
+
+def test_slack_counts_a_sample_for_the_previous_bucket():
+    r = resampler(slack=60)
+    r.add(1290, sample(100))
+    r.add(1530, sample(300))
+    assert [ (b['time'], b['pgrid_w']) for b in r.close(1530) ] == [(1500, 200)]
+
+def test_sample_for_a_closed_bucket_goes_into_the_next():
+    r = resampler(slack=60)
+    r.add(1290, sample(100))
+    assert len(r.close(1500)) == 1
+    r.add(1530, sample(300))
+    assert r.close(1530) == []
+    assert [ (b['time'], b['pgrid_w']) for b in r.close(1800) ] == [(1800, 300)]
+
+def test_resample_labels_buckets_by_their_end():
+    result = resample.resample([1210, 1320, 1500, 1510], 300, mean={ 'p' : [1, 3, 5, 7] }, last={ 'e' : [1, 2, 3, 4] })
+    assert list(result['time']) == [1500, 1800]
+    assert list(result['p']) == [3, 7]
+    assert list(result['e']) == [3, 4]
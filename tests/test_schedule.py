@@ -0,0 +1,93 @@
+import pytest
+
+from gw2pvo import metrics
+from gw2pvo import schedule
+
+def scheduler(clock, interval=300):
+    return schedule.Scheduler(interval, clock=clock.monotonic, wallclock=clock.time, sleep=clock.sleep)
+
+def test_wakes_up_on_wall_clock_boundaries(clock):
+    s = scheduler(clock)
+    for i in range(3):
+        start = s.wait()
+        assert start == clock.monotonic()
+        assert clock.time() % 300 == 0
+        clock.advance(12)
+
+def test_slow_cycle_does_not_shift_the_next_ones(clock):
+    s = scheduler(clock)
+    first = s.wait()
+    clock.advance(290)
+    assert s.wait() == first + 300
+
+def test_slightly_late_boundary_still_runs(clock):
+    s = scheduler(clock)
+    first = s.wait()
+    clock.advance(300 + 30)
+    assert s.wait() == first + 300
+    assert clock.monotonic() == first + 330
+
+def test_missed_boundaries_are_skipped(clock):
+    s = scheduler(clock)
+    skipped = metrics.SKIPPED_CYCLES.values.get((), 0)
+    first = s.wait()
+    # Overran the next boundary by more than MAX_LATE, and the one after that
+    clock.advance(2 * 300 + 100)
+    start = s.wait()
+    assert start == first + 3 * 300
+    assert clock.monotonic() == start
+    assert metrics.SKIPPED_CYCLES.values.get((), 0) == skipped + 2
+
+def test_follows_a_wall_clock_step(clock):
+    s = scheduler(clock)
+    s.wait()
+    clock.set_wall(-40)
+    s.wait()
+    assert clock.time() % 300 == 0
+
+def test_resume_waits_for_the_first_boundary_after_it(clock):
+    s = scheduler(clock)
+    resume = clock.time() + 1000
+    s.wait(resume)
+    assert clock.time() >= resume
+    assert clock.time() - resume < 300
+    assert clock.time() % 300 == 0
+
+def test_due_per_station_interval(clock):
+    s = scheduler(clock)
+    due = []
+    for i in range(6):
+        start = s.wait()
+        due.append((clock.time() % 600 == 0, s.due(start, 600), s.due(start, 900), clock.time() % 900 == 0))
+    for on_600, due_600, due_900, on_900 in due:
+        assert due_600 == on_600
+        assert due_900 == on_900
+    assert any(on_600 for on_600, _, _, _ in due)
+
+def test_stage_deadlines(clock):
+    cycle = schedule.Cycle(clock.monotonic(), 300, clock.monotonic)
+    assert cycle.deadline('fetch') == clock.monotonic() + 150
+    assert cycle.deadline('upload') == clock.monotonic() + 270
+    clock.advance(100)
+    assert cycle.remaining('fetch') == 50
+    assert not cycle.expired('fetch')
+    clock.advance(60)
+    assert cycle.remaining('fetch') == 0
+    assert cycle.expired('fetch')
+    assert not cycle.expired('csv')
+
+def test_stage_overrun_is_counted(clock):
+    cycle = schedule.Cycle(clock.monotonic(), 300, clock.monotonic)
+    overruns = metrics.STAGE_OVERRUNS.values.get(('weather',), 0)
+    with cycle.stage('weather'):
+        clock.advance(100)
+    assert metrics.STAGE_OVERRUNS.values.get(('weather',), 0) == overruns
+    with cycle.stage('weather'):
+        clock.advance(100)
+    assert metrics.STAGE_OVERRUNS.values.get(('weather',), 0) == overruns + 1
+
+def test_stage_does_not_swallow_exceptions(clock):
+    cycle = schedule.Cycle(clock.monotonic(), 300, clock.monotonic)
+    with pytest.raises(ValueError):
+        with cycle.stage('fetch'):
+            raise ValueError()
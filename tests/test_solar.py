@@ -0,0 +1,30 @@
+from datetime import date
+
+from gw2pvo import solar
+
+INTERVAL = 300
+
+def test_active_from_dawn_until_an_interval_after_dusk():
+    schedule = solar.SolarSchedule.at(52.37, 4.89)
+    dawn, dusk = schedule.times(date(2020, 6, 1))
+    assert 12 * 3600 < dusk - dawn < 20 * 3600
+    assert not schedule.active(dawn - 1, INTERVAL)
+    assert schedule.active(dawn, INTERVAL)
+    assert schedule.active((dawn + dusk) / 2, INTERVAL)
+    assert schedule.active(dusk + INTERVAL - 1, INTERVAL)
+    assert not schedule.active(dusk + INTERVAL, INTERVAL)
+
+def test_next_active_is_dawn():
+    schedule = solar.SolarSchedule.at(52.37, 4.89)
+    dawn, dusk = schedule.times(date(2020, 6, 1))
+    tomorrow, _ = schedule.times(date(2020, 6, 2))
+    assert schedule.next_active(dawn - 3600, INTERVAL) == dawn
+    assert schedule.next_active(dusk + INTERVAL, INTERVAL) == tomorrow
+    assert schedule.next_active(dawn + 3600, INTERVAL) == dawn + 3600
+    assert tomorrow - dawn < 86400 + 600
+
+def test_polar_day_is_always_active():
+    schedule = solar.SolarSchedule.at(78.22, 15.65)
+    assert schedule.times(date(2020, 6, 21)) is None
+    noon, _ = solar.SolarSchedule.at(52.37, 4.89).times(date(2020, 6, 21))
+    assert schedule.active(noon, INTERVAL)
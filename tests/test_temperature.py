@@ -0,0 +1,40 @@
+from benchmarks.temperature import filter_lookup
+from gw2pvo.temperature import TemperatureSeries
+
+SAMPLES = [
+    { 'time' : 7200, 'temperature' : 14.0 },
+    { 'time' : 0, 'temperature' : 10.0 },
+    { 'time' : 3600, 'temperature' : 12.0 },
+]
+
+def test_matches_the_linear_scan():
+    series = TemperatureSeries(SAMPLES)
+    times = list(range(0, 10800, 300))
+    assert [ series.at(t) for t in times ] == filter_lookup(sorted(SAMPLES, key=lambda x: x['time']), times)
+
+def test_most_recent_sample():
+    series = TemperatureSeries(SAMPLES)
+    assert series.at(3599) == 10.0
+    assert series.at(3600) == 12.0
+    assert series.at(99999) == 14.0
+
+def test_before_the_first_sample():
+    assert TemperatureSeries(SAMPLES).at(-1) is None
+    assert TemperatureSeries([]).at(0) is None
+    assert TemperatureSeries(None).at(0) is None
+
+def test_interpolates_between_samples():
+    series = TemperatureSeries(SAMPLES, interpolate=True)
+    assert series.at(1800) == 11.0
+    assert series.at(3600) == 12.0
+    assert series.at(4500) == 12.5
+    # After the last sample it is kept
+    assert series.at(9000) == 14.0
+
+def test_skips_incomplete_samples():
+    series = TemperatureSeries(SAMPLES + [
+        { 'time' : 1800, 'temperature' : None },
+        { 'time' : None, 'temperature' : 20.0 },
+    ])
+    assert len(series) == 3
+    assert series.at(1800) == 10.0
@@ -0,0 +1,83 @@
+import json
+import time
+
+import requests
+
+from gw2pvo import pvo_api
+
+HEADER = 'date,eday_kwh,pgrid_w,energy_used,load,temp,voltage'
+
+class Response:
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.reason = self.text = 'OK' if status_code == 200 else 'Bad request'
+        self.headers = {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(self.text, response=self)
+
+class Transport:
+    ''' Accepts the first `accept` posts, then fails. '''
+
+    def __init__(self, accept=None):
+        self.accept = accept
+        self.uploaded = []
+
+    def post(self, url, headers=None, data=None):
+        if self.accept is not None and len(self.uploaded) >= self.accept:
+            return Response(400)
+        self.uploaded.append(data['data'])
+        return Response(200)
+
+def write_csv(path, count):
+    with open(str(path), 'w', encoding='utf-8-sig') as f:
+        f.write(HEADER + '\n')
+        for i in range(count):
+            f.write('2020-06-01 12:{:02},{},{},2.0,400,,230\n'.format(i, i / 10, i * 100))
+
+def upload(path, resume_file, transport):
+    pvo = pvo_api.PVOutputApi(None, None, 'csv', 'key', transport=transport, batch_size=2, deadline=time.monotonic())
+    return pvo.add_day_csv(str(path), resume_file=str(resume_file))
+
+def minutes(transport):
+    return [ reading.split(', ')[1] for batch in transport.uploaded for reading in batch.split(';') ]
+
+def test_resumes_after_the_uploaded_rows(tmp_path):
+    path = tmp_path / 'gw.csv'
+    resume_file = tmp_path / 'upload-csv.json'
+    write_csv(path, 5)
+
+    transport = Transport(accept=1)
+    assert not upload(path, resume_file, transport)
+    assert minutes(transport) == ['12:00', '12:01']
+    offsets = json.loads(resume_file.read_text())
+    assert list(offsets.values()) == [ { 'rows' : 2, 'size' : path.stat().st_size } ]
+
+    transport = Transport()
+    assert upload(path, resume_file, transport)
+    assert minutes(transport) == ['12:02', '12:03', '12:04']
+    assert json.loads(resume_file.read_text()) == {}
+
+def test_resumes_in_a_grown_file(tmp_path):
+    path = tmp_path / 'gw.csv'
+    resume_file = tmp_path / 'upload-csv.json'
+    write_csv(path, 3)
+    assert not upload(path, resume_file, Transport(accept=1))
+
+    write_csv(path, 4)
+    transport = Transport()
+    assert upload(path, resume_file, transport)
+    assert minutes(transport) == ['12:02', '12:03']
+
+def test_starts_over_in_a_smaller_file(tmp_path):
+    path = tmp_path / 'gw.csv'
+    resume_file = tmp_path / 'upload-csv.json'
+    write_csv(path, 5)
+    assert not upload(path, resume_file, Transport(accept=1))
+
+    write_csv(path, 3)
+    transport = Transport()
+    assert upload(path, resume_file, transport)
+    assert minutes(transport) == ['12:00', '12:01', '12:02']
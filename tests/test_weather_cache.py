@@ -0,0 +1,59 @@
+import json
+import threading
+import time
+
+from gw2pvo.weather_cache import WeatherCache
+
+def fetcher(*temperatures):
+    calls = []
+    def fetch():
+        calls.append(1)
+        return temperatures[len(calls) - 1]
+    fetch.calls = calls
+    return fetch
+
+def store(filename, temperature, age):
+    with open(filename, 'w') as f:
+        json.dump({ '52.37,4.90' : { 'temperature' : temperature, 'time' : time.time() - age } }, f)
+
+def test_shared_between_runs(tmp_path):
+    filename = str(tmp_path / 'weather.json')
+    fetch = fetcher(12.5)
+    assert WeatherCache(filename=filename).get(52.371, 4.899, fetch) == 12.5
+
+    # A next run reuses the saved temperature
+    fetch = fetcher()
+    assert WeatherCache(filename=filename).get(52.371, 4.899, fetch) == 12.5
+    assert not fetch.calls
+
+def test_expired_is_refreshed_in_the_background(tmp_path):
+    filename = str(tmp_path / 'weather.json')
+    store(filename, 10.0, 2000)
+    weather = WeatherCache(ttl=1800, filename=filename)
+    fetch = fetcher(11.0)
+    assert weather.get(52.37, 4.90, fetch) == 10.0
+    for thread in threading.enumerate():
+        if thread.name == 'weather-refresh':
+            thread.join()
+    assert fetch.calls == [1]
+    assert weather.get(52.37, 4.90, fetch) == 11.0
+    assert WeatherCache(filename=filename).get(52.37, 4.90, fetcher()) == 11.0
+
+def test_too_old_is_fetched_right_away(tmp_path):
+    filename = str(tmp_path / 'weather.json')
+    store(filename, 10.0, 4 * 1800 + 1)
+    fetch = fetcher(11.0)
+    assert WeatherCache(ttl=1800, filename=filename).get(52.37, 4.90, fetch) == 11.0
+
+def test_failed_fetch_is_not_cached(tmp_path):
+    filename = str(tmp_path / 'weather.json')
+    def fail():
+        raise IOError("unreachable")
+    weather = WeatherCache(filename=filename)
+    assert weather.get(52.37, 4.90, fail) is None
+    assert weather.get(52.37, 4.90, fetcher(9.0)) == 9.0
+
+def test_corrupt_file_is_ignored(tmp_path):
+    filename = tmp_path / 'weather.json'
+    filename.write_text('[1, 2')
+    assert WeatherCache(filename=str(filename)).get(52.37, 4.90, fetcher(9.0)) == 9.0